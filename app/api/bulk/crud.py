@@ -0,0 +1,248 @@
+import json
+from collections import defaultdict
+from collections.abc import AsyncIterator, Callable
+from datetime import datetime
+from fastapi import Request
+from pydantic import ValidationError
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.api.bulk.models import ImportReport, LineError
+from app.api.invalidation import catalog_changed, plan_changed
+from app.api.reviews.models import Review
+from app.api.trainers.models import TrainingPlan
+from app.config.config import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_CHUNK_BYTES,
+    IMPORT_BATCH_SIZE,
+    IMPORT_MAX_ERRORS,
+)
+from app.config.database import REVIEWS_COLLECTION_NAME, TRAININGS_COLLECTION_NAME
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def export_documents(
+    r: Request,
+    collection: str,
+    projection: dict | None = None,
+    updated_since: datetime | None = None,
+) -> AsyncIterator[bytes]:
+    """Yields the collection as NDJSON, in chunks of about EXPORT_CHUNK_BYTES.
+
+    Documents are read from the cursor one batch at a time and the next chunk
+    is only built once the previous one was sent, so memory doesn't grow with
+    the size of the collection and a slow client slows down the reads.
+    """
+    db = r.app.mongodb
+    query = {}
+    sort = None
+    if updated_since is not None:
+        query["updated_at"] = {"$gte": updated_since}
+        # Lets the consumer resume from the last updated_at it received
+        sort = [("updated_at", ASCENDING)]
+
+    cursor = db[collection].find(
+        query, projection, sort=sort, batch_size=EXPORT_BATCH_SIZE
+    )
+    chunk = []
+    size = 0
+    try:
+        async for document in cursor:
+            line = json.dumps(document, default=encode_value).encode() + b"\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield b"".join(chunk)
+                chunk = []
+                size = 0
+
+        if chunk:
+            yield b"".join(chunk)
+    finally:
+        await cursor.close()
+
+
+async def read_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, bytes]]:
+    """Splits a streamed body in numbered lines, skipping the blank ones"""
+    number = 0
+    rest = b""
+    async for chunk in stream:
+        *lines, rest = (rest + chunk).split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+
+    if rest.strip():
+        yield number + 1, rest
+
+
+def validation_message(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+        for error in e.errors()
+    )
+
+
+def plan_document(plan: TrainingPlan) -> dict:
+    document = plan.dict(by_alias=True)
+    document["_id"] = str(document["_id"])
+    document["difficulty"] = plan.difficulty.value
+    document["favourite_count"] = 0
+    document["review_count"] = 0
+    document["review_score_sum"] = 0
+    document["version"] = 1
+    return document
+
+
+def review_document(review: Review) -> dict:
+    document = review.dict(by_alias=True)
+    document["_id"] = str(document["_id"])
+    return document
+
+
+class Importer:
+    """Validates NDJSON lines and inserts them in unordered batches.
+
+    Lines that fail, either on validation or on insert, are reported with
+    their line number without stopping the rest of the import.
+    """
+
+    def __init__(
+        self,
+        r: Request,
+        collection: str,
+        model: type,
+        to_document: Callable[[object], dict],
+        duplicate_error: str,
+    ):
+        self.r = r
+        self.collection = collection
+        self.model = model
+        self.to_document = to_document
+        self.duplicate_error = duplicate_error
+        self.report = ImportReport()
+
+    def fail(self, line: int, error: str):
+        self.report.failed += 1
+        if len(self.report.errors) < IMPORT_MAX_ERRORS:
+            self.report.errors.append(LineError(line=line, error=error))
+
+    async def run(self, stream: AsyncIterator[bytes]) -> ImportReport:
+        batch = []
+        async for number, line in read_lines(stream):
+            try:
+                item = self.model.parse_obj(json.loads(line))
+            except ValidationError as e:
+                self.fail(number, validation_message(e))
+                continue
+            except ValueError as e:
+                # Also raised by json.loads on lines that aren't UTF-8
+                self.fail(number, f"invalid json: {e}")
+                continue
+
+            batch.append((number, item))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await self.insert(batch)
+                batch = []
+
+        if batch:
+            await self.insert(batch)
+        return self.report
+
+    async def insert(self, batch: list[tuple[int, object]]):
+        db = self.r.app.mongodb
+        documents = [self.to_document(item) for _, item in batch]
+
+        failed = set()
+        try:
+            await db[self.collection].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                failed.add(error["index"])
+                message = error["errmsg"]
+                if error["code"] == DUPLICATE_KEY_ERROR:
+                    message = self.duplicate_error
+                self.fail(batch[error["index"]][0], message)
+
+        inserted = [doc for i, doc in enumerate(documents) if i not in failed]
+        self.report.inserted += len(inserted)
+        if inserted:
+            # insert_many can't take the write time from the database clock,
+            # which is what the readers of updated_at compare it with
+            await db[self.collection].update_many(
+                {"_id": {"$in": [doc["_id"] for doc in inserted]}},
+                {"$currentDate": {"updated_at": True}},
+            )
+        await self.inserted(inserted)
+
+    async def inserted(self, documents: list[dict]):
+        pass
+
+
+class PlanImporter(Importer):
+    def __init__(self, r: Request):
+        super().__init__(
+            r,
+            TRAININGS_COLLECTION_NAME,
+            TrainingPlan,
+            plan_document,
+            "plan already exists",
+        )
+
+    async def inserted(self, documents: list[dict]):
+        for plan in documents:
+            plan_changed(self.r.app, plan["_id"])
+        if documents:
+            catalog_changed(self.r.app)
+
+
+class ReviewImporter(Importer):
+    def __init__(self, r: Request):
+        super().__init__(
+            r, REVIEWS_COLLECTION_NAME, Review, review_document, "review already exists"
+        )
+
+    async def inserted(self, documents: list[dict]):
+        """Adds the batch to the counters of the reviewed plans, one update per plan"""
+        counts = defaultdict(int)
+        sums = defaultdict(int)
+        for review in documents:
+            counts[review["plan_id"]] += 1
+            sums[review["plan_id"]] += review["score"]
+
+        if not counts:
+            return
+
+        db = self.r.app.mongodb
+        requests = [
+            UpdateOne(
+                {"_id": plan_id},
+                {
+                    "$inc": {
+                        "review_count": count,
+                        "review_score_sum": sums[plan_id],
+                        "reviews_version": 1,
+                    },
+                    "$currentDate": {"updated_at": True},
+                },
+            )
+            for plan_id, count in counts.items()
+        ]
+        await db[TRAININGS_COLLECTION_NAME].bulk_write(requests, ordered=False)
+        for plan_id in counts:
+            plan_changed(self.r.app, plan_id)
+
+
+async def import_plans(r: Request, stream: AsyncIterator[bytes]) -> ImportReport:
+    return await PlanImporter(r).run(stream)
+
+
+async def import_reviews(r: Request, stream: AsyncIterator[bytes]) -> ImportReport:
+    return await ReviewImporter(r).run(stream)
@@ -0,0 +1,22 @@
+from pydantic import BaseModel, Field
+
+
+class LineError(BaseModel):
+    line: int = Field(...)
+    error: str = Field(...)
+
+
+class ImportReport(BaseModel):
+    inserted: int = Field(default=0)
+    failed: int = Field(default=0)
+    # Only the first IMPORT_MAX_ERRORS are reported
+    errors: list[LineError] = Field(default_factory=list)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "inserted": 2,
+                "failed": 1,
+                "errors": [{"line": 2, "error": "review already exists"}],
+            }
+        }
@@ -0,0 +1,53 @@
+from datetime import datetime
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from app.api.bulk import crud
+from app.api.bulk.models import ImportReport
+from app.config.config import logger
+from app.config.database import REVIEWS_COLLECTION_NAME, TRAININGS_COLLECTION_NAME
+
+router = APIRouter(prefix="/admin", tags=["bulk"])
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def export_projection(fields: str | None) -> dict | None:
+    if fields is None:
+        return None
+    return {field.strip(): 1 for field in fields.split(",") if field.strip()}
+
+
+@router.get("/export/plans")
+async def export_plans(
+    request: Request, fields: str | None = None, updated_since: datetime | None = None
+):
+    logger.info("exporting plans", fields=fields, updated_since=updated_since)
+    documents = crud.export_documents(
+        request, TRAININGS_COLLECTION_NAME, export_projection(fields), updated_since
+    )
+    return StreamingResponse(documents, media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.get("/export/reviews")
+async def export_reviews(
+    request: Request, fields: str | None = None, updated_since: datetime | None = None
+):
+    logger.info("exporting reviews", fields=fields, updated_since=updated_since)
+    documents = crud.export_documents(
+        request, REVIEWS_COLLECTION_NAME, export_projection(fields), updated_since
+    )
+    return StreamingResponse(documents, media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.post("/import/plans", response_model=ImportReport)
+async def import_plans(request: Request):
+    report = await crud.import_plans(request, request.stream())
+    logger.info("imported plans", inserted=report.inserted, failed=report.failed)
+    return report
+
+
+@router.post("/import/reviews", response_model=ImportReport)
+async def import_reviews(request: Request):
+    report = await crud.import_reviews(request, request.stream())
+    logger.info("imported reviews", inserted=report.inserted, failed=report.failed)
+    return report
@@ -0,0 +1,110 @@
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+class EntityCache:
+    """Bounded in-process LRU cache whose entries expire after a TTL.
+
+    The size limit is enforced both on the number of entries and on an
+    estimate of their size in bytes, taken from their JSON representation.
+
+    Invalidating a key also bumps its epoch. A load takes the epoch before
+    reading and passes it to set, which drops the value if the key was
+    invalidated meanwhile, so a read that raced a write can't put the old
+    value back. Epochs live in a fixed number of slots shared by hash, so
+    they take no room per key; keys sharing a slot only skip a refill.
+    """
+
+    EPOCH_SLOTS = 4096
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.stats = CacheStats()
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self._epochs = [0] * self.EPOCH_SLOTS
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def epoch(self, key: Hashable) -> int:
+        return self._epochs[hash(key) % self.EPOCH_SLOTS]
+
+    def set(self, key: Hashable, value: Any, epoch: int | None = None):
+        if epoch is not None and epoch != self.epoch(key):
+            return
+
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.size += size
+
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._remove(key)
+        self._epochs[hash(key) % self.EPOCH_SLOTS] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+class ListingCache(EntityCache):
+    """EntityCache for query results that go stale all together.
+
+    Keys are scoped by a generation: bumping it makes every cached result
+    unreachable without enumerating them, they age out through the LRU.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        super().__init__(max_entries, max_bytes, ttl)
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        return super().get((self.generation, key))
+
+    def set(self, key: Hashable, value: Any):
+        super().set((self.generation, key), value)
+
+    def bump(self):
+        self.generation += 1
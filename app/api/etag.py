@@ -0,0 +1,46 @@
+import hashlib
+import json
+from fastapi import Response, status
+
+ETAG_HEADER = "ETag"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag of a representation, parts must change whenever it does"""
+    encoded = json.dumps(parts, default=str).encode()
+    return f'"{hashlib.blake2b(encoded, digest_size=16).hexdigest()}"'
+
+
+def plan_etag(plan_id: str, version: int) -> str:
+    return make_etag("plan", plan_id, version)
+
+
+def reviews_etag(
+    plan_id: str, version: int, skip: int, limit: int, after: dict | None
+) -> str:
+    # Every page of the same reviews has a different ETag
+    return make_etag("reviews", plan_id, version, skip, limit, after)
+
+
+def plans_etag(versions: list[tuple[str, int]], fields: list[str] | None) -> str:
+    """fields are the ones returned, None when it's the full plan, so each view
+    of the same plans has a different ETag"""
+    return make_etag("plans", versions, fields)
+
+
+def etag_matches(header: str | None, etag: str, weak: bool = True) -> bool:
+    """Compares an If-None-Match (weak) or If-Match (strong) header to an ETag"""
+    if header is None:
+        return False
+
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag == etag or (weak and tag == f"W/{etag}"):
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers={ETAG_HEADER: etag}
+    )
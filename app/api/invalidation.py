@@ -0,0 +1,44 @@
+from fastapi import FastAPI
+
+
+def plan_key(plan_id: str) -> tuple:
+    return ("plan", plan_id)
+
+
+def review_stats_key(plan_id: str) -> tuple:
+    return ("review_stats", plan_id)
+
+
+def plans_key(
+    skip: int,
+    limit: int,
+    admin: bool,
+    difficulty: str | None,
+    types: list[str] | None,
+    after: dict | None,
+    projection: dict | None,
+) -> tuple:
+    """Key of a plan listing, equivalent filters share the same key"""
+    return (
+        "plans",
+        skip,
+        limit,
+        admin,
+        difficulty,
+        tuple(sorted(set(types))) if types else None,
+        after["_id"] if after is not None else None,
+        tuple(sorted(projection)) if projection is not None else None,
+    )
+
+
+def plan_changed(app: FastAPI, plan_id: str):
+    """Drops everything this process keeps about the plan after it's written"""
+    app.entity_cache.invalidate(plan_key(plan_id))
+    app.entity_cache.invalidate(review_stats_key(plan_id))
+    app.leaderboard_refresher.mark(plan_id)
+    app.plan_index_refresher.mark(plan_id)
+
+
+def catalog_changed(app: FastAPI):
+    """Makes every cached plan listing stale after a plan is added or edited"""
+    app.listing_cache.bump()
@@ -0,0 +1,206 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, DeleteOne, ReplaceOne
+from app.api.leaderboards.models import Leaderboard, LeaderboardEntry
+from app.api.trainers.models import Difficulty
+from app.config.config import LEADERBOARD_PRIOR_WEIGHT, LEADERBOARD_TREND_DAYS
+from app.config.database import (
+    FAVOURITES_COLLECTION_NAME,
+    RANKINGS_COLLECTION_NAME,
+    TRAININGS_COLLECTION_NAME,
+)
+
+REFRESH_BATCH_SIZE = 1000
+
+RANKING_FIELDS = {
+    "title": 1,
+    "trainer": 1,
+    "difficulty": 1,
+    "training_types": 1,
+    "blocked": 1,
+    "review_count": 1,
+    "review_score_sum": 1,
+}
+
+SORT_FIELDS = {Leaderboard.top: "score", Leaderboard.trending: "trend"}
+
+
+def bayesian_average(count: int, total: int, prior_mean: float) -> float:
+    """Mean score pulled towards the mean of every plan, less so the more
+    reviews the plan has"""
+    return (LEADERBOARD_PRIOR_WEIGHT * prior_mean + total) / (
+        LEADERBOARD_PRIOR_WEIGHT + count
+    )
+
+
+def ranking_document(
+    plan: dict,
+    trend: int,
+    prior_mean: float,
+    refreshed_at: datetime,
+    rebuild_id: str | None = None,
+) -> dict:
+    count = plan.get("review_count", 0)
+    total = plan.get("review_score_sum", 0)
+    return {
+        "_id": plan["_id"],
+        "title": plan["title"],
+        "trainer": plan["trainer"],
+        "difficulty": plan["difficulty"],
+        "training_types": plan["training_types"],
+        "review_count": count,
+        "mean": total / count if count else 0,
+        "score": bayesian_average(count, total, prior_mean),
+        "trend": trend,
+        "refreshed_at": refreshed_at,
+        "rebuild_id": rebuild_id,
+    }
+
+
+def trend_start() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=LEADERBOARD_TREND_DAYS)
+
+
+async def get_trends(db: AsyncIOMotorDatabase, plan_ids: list[str] | None) -> dict:
+    """Favourites added to each plan within the trend window"""
+    match = {"created_at": {"$gte": trend_start()}}
+    if plan_ids is not None:
+        match["plan_id"] = {"$in": plan_ids}
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$plan_id", "count": {"$sum": 1}}},
+    ]
+    return {
+        trend["_id"]: trend["count"]
+        async for trend in db[FAVOURITES_COLLECTION_NAME].aggregate(pipeline)
+    }
+
+
+async def get_prior_mean(db: AsyncIOMotorDatabase) -> float:
+    """Mean score of every review, from the counters kept on the plans"""
+    pipeline = [
+        {
+            "$group": {
+                "_id": None,
+                "count": {"$sum": "$review_count"},
+                "total": {"$sum": "$review_score_sum"},
+            }
+        }
+    ]
+    async for totals in db[TRAININGS_COLLECTION_NAME].aggregate(pipeline):
+        if totals["count"]:
+            return totals["total"] / totals["count"]
+    return 0
+
+
+async def refresh_rankings(
+    db: AsyncIOMotorDatabase, plan_ids: list[str], prior_mean: float
+):
+    """Recomputes the rankings of the given plans from their counters.
+
+    Blocked and deleted plans are taken out of the leaderboards.
+    """
+    now = datetime.now(timezone.utc)
+    plans = {
+        plan["_id"]: plan
+        async for plan in db[TRAININGS_COLLECTION_NAME].find(
+            {"_id": {"$in": plan_ids}}, RANKING_FIELDS
+        )
+    }
+    trends = await get_trends(db, plan_ids)
+
+    requests = []
+    for plan_id in plan_ids:
+        plan = plans.get(plan_id)
+        if plan is None or plan.get("blocked"):
+            requests.append(DeleteOne({"_id": plan_id}))
+            continue
+
+        ranking = ranking_document(plan, trends.get(plan_id, 0), prior_mean, now)
+        requests.append(ReplaceOne({"_id": plan_id}, ranking, upsert=True))
+
+    if requests:
+        await db[RANKINGS_COLLECTION_NAME].bulk_write(requests, ordered=False)
+
+
+async def rebuild_rankings(db: AsyncIOMotorDatabase) -> float:
+    """Recomputes every ranking and returns the prior mean it used.
+
+    Besides picking up a new prior mean, it's what makes old favourites fall
+    out of the trend of plans that weren't written since.
+
+    Rankings are tagged with the id of the rebuild that wrote them. The ones
+    it didn't write, because another process or refresh wrote them last, or
+    because their plan is gone, are only removed once their plan is found
+    blocked or deleted, so rebuilds running at the same time don't remove
+    each other's rankings.
+    """
+    started = datetime.now(timezone.utc)
+    rebuild_id = uuid4().hex
+    prior_mean = await get_prior_mean(db)
+    trends = await get_trends(db, None)
+
+    requests = []
+    async for plan in db[TRAININGS_COLLECTION_NAME].find(
+        {"blocked": False}, RANKING_FIELDS
+    ):
+        ranking = ranking_document(
+            plan, trends.get(plan["_id"], 0), prior_mean, started, rebuild_id
+        )
+        requests.append(ReplaceOne({"_id": plan["_id"]}, ranking, upsert=True))
+        if len(requests) >= REFRESH_BATCH_SIZE:
+            await db[RANKINGS_COLLECTION_NAME].bulk_write(requests, ordered=False)
+            requests = []
+
+    if requests:
+        await db[RANKINGS_COLLECTION_NAME].bulk_write(requests, ordered=False)
+
+    # Plans blocked or deleted without being refreshed
+    others = [
+        ranking["_id"]
+        async for ranking in db[RANKINGS_COLLECTION_NAME].find(
+            {"rebuild_id": {"$ne": rebuild_id}}, {"_id": 1}
+        )
+    ]
+    for start in range(0, len(others), REFRESH_BATCH_SIZE):
+        end = start + REFRESH_BATCH_SIZE
+        batch = others[start:end]
+        live = {
+            plan["_id"]
+            async for plan in db[TRAININGS_COLLECTION_NAME].find(
+                {"_id": {"$in": batch}, "blocked": False}, {"_id": 1}
+            )
+        }
+        gone = [plan_id for plan_id in batch if plan_id not in live]
+        if gone:
+            await db[RANKINGS_COLLECTION_NAME].delete_many({"_id": {"$in": gone}})
+    return prior_mean
+
+
+async def get_leaderboard(
+    r: Request,
+    leaderboard: Leaderboard,
+    difficulty: Difficulty | None,
+    training_type: str | None,
+    limit: int,
+) -> list[LeaderboardEntry]:
+    db = r.app.mongodb
+    query = {}
+    if difficulty is not None:
+        query["difficulty"] = difficulty
+
+    if training_type is not None:
+        query["training_types"] = training_type
+
+    return [
+        ranking
+        async for ranking in db[RANKINGS_COLLECTION_NAME].find(
+            query,
+            {"refreshed_at": 0, "rebuild_id": 0},
+            limit=limit,
+            sort=[(SORT_FIELDS[leaderboard], DESCENDING), ("_id", ASCENDING)],
+        )
+    ]
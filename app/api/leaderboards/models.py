@@ -0,0 +1,38 @@
+from enum import Enum
+from pydantic import BaseModel, Field
+from app.api.trainers.models import Difficulty
+
+
+class Leaderboard(str, Enum):
+    top = "top"
+    trending = "trending"
+
+
+class LeaderboardEntry(BaseModel):
+    id: str = Field(..., alias="_id")
+    title: str = Field(...)
+    trainer: str = Field(...)
+    difficulty: Difficulty
+    training_types: list[str] = Field(...)
+    review_count: int = Field(...)
+    mean: float = Field(...)
+    # Bayesian average of the reviews
+    score: float = Field(...)
+    # Favourites added within the trend window
+    trend: int = Field(...)
+
+    class Config:
+        allow_population_by_field_name = True
+        schema_extra = {
+            "example": {
+                "_id": "c59710ef-f5d0-41ba-a787-ad8eb739ef4c",
+                "title": "Sample training plan",
+                "trainer": "7ca0fa95-af47-40b4-8e39-2fae5ee2667a",
+                "difficulty": "beginner",
+                "training_types": ["cardio"],
+                "review_count": 12,
+                "mean": 4.5,
+                "score": 4.21,
+                "trend": 8,
+            }
+        }
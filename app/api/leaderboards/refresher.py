@@ -0,0 +1,86 @@
+import asyncio
+import time
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.api.leaderboards.crud import (
+    REFRESH_BATCH_SIZE,
+    rebuild_rankings,
+    refresh_rankings,
+)
+from app.config.config import logger
+
+
+class LeaderboardRefresher:
+    """Keeps the plan rankings up to date in the background.
+
+    Writes only mark the plan as dirty. Every interval the dirty plans are
+    ranked again from their counters, and every rebuild_interval all of them
+    are, which also refreshes the prior mean and expires old trends.
+    """
+
+    def __init__(
+        self, db: AsyncIOMotorDatabase, interval: float, rebuild_interval: float
+    ):
+        self.db = db
+        self.interval = interval
+        self.rebuild_interval = rebuild_interval
+        self.prior_mean: float | None = None
+        self._dirty: set[str] = set()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def mark(self, plan_id: str):
+        self._dirty.add(plan_id)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._dirty and self.prior_mean is not None:
+            logger.info("refreshing pending rankings", plans=len(self._dirty))
+            await self.refresh()
+
+    async def rebuild(self):
+        # Plans written while rebuilding are marked again, and the ones marked
+        # before are kept for the next refresh if it fails
+        dirty = self._dirty
+        self._dirty = set()
+        try:
+            self.prior_mean = await rebuild_rankings(self.db)
+        except Exception:
+            self._dirty.update(dirty)
+            raise
+
+    async def refresh(self):
+        dirty = list(self._dirty)
+        self._dirty = set()
+        for start in range(0, len(dirty), REFRESH_BATCH_SIZE):
+            end = start + REFRESH_BATCH_SIZE
+            batch = dirty[start:end]
+            try:
+                await refresh_rankings(self.db, batch, self.prior_mean)
+            except Exception as e:
+                logger.info("failed to refresh rankings", error=str(e))
+                self._dirty.update(batch)
+
+    async def _run(self):
+        last_rebuild = None
+        while True:
+            if last_rebuild is None or (
+                time.monotonic() - last_rebuild >= self.rebuild_interval
+            ):
+                try:
+                    await self.rebuild()
+                    last_rebuild = time.monotonic()
+                except Exception as e:
+                    logger.info("failed to rebuild rankings", error=str(e))
+            elif self._dirty:
+                await self.refresh()
+
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Query, Request
+from app.api.leaderboards import crud
+from app.api.leaderboards.models import Leaderboard, LeaderboardEntry
+from app.api.pagination import page_size
+from app.api.trainers.models import Difficulty
+
+router = APIRouter(tags=["leaderboards"])
+
+
+@router.get("/leaderboards/{leaderboard}", response_model=list[LeaderboardEntry])
+async def get_leaderboard(
+    leaderboard: Leaderboard,
+    request: Request,
+    difficulty: Difficulty | None = Query(default=None),
+    training_type: str | None = None,
+    limit: int = 25,
+):
+    """Best rated (top) or most favourited lately (trending) plans, overall or
+    for a difficulty or training type"""
+    return await crud.get_leaderboard(
+        request, leaderboard, difficulty, training_type, page_size(limit)
+    )
@@ -0,0 +1,91 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.api.metrics.service import MetricsService, get_metrics
+from app.api.monitoring.instruments import METRICS_UPDATES_DROPPED
+from app.config.config import logger
+
+
+class MetricsDispatcher:
+    """Pushes plan metrics to the metrics service in the background.
+
+    Writes only enqueue the plan id. Every update of the same plan that arrives
+    while it is still pending is merged into a single push, sent once the
+    flush window elapses.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        service: MetricsService,
+        queue_size: int,
+        window: float,
+    ):
+        self.db = db
+        self.service = service
+        self.window = window
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self._pending: set[str] = set()
+        self._batch: set[str] = set()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, plan_id: str):
+        if plan_id in self._pending:
+            return
+
+        try:
+            self._queue.put_nowait(plan_id)
+        except asyncio.QueueFull:
+            logger.info("metrics queue full, dropping update", plan=plan_id)
+            METRICS_UPDATES_DROPPED.inc()
+            return
+        self._pending.add(plan_id)
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Whatever was in flight or still queued is sent before shutting down
+        batch = self._batch | self._drain()
+        if batch:
+            logger.info("draining metrics queue", plans=len(batch))
+            await self._flush(batch)
+
+    async def _run(self):
+        while True:
+            plan_id = await self._queue.get()
+            self._queue.task_done()
+            self._batch = {plan_id}
+            await asyncio.sleep(self.window)
+            self._batch |= self._drain()
+            self._pending.discard(plan_id)
+            await self._flush(self._batch)
+            self._batch = set()
+
+    def _drain(self) -> set[str]:
+        batch = set()
+        while not self._queue.empty():
+            plan_id = self._queue.get_nowait()
+            self._queue.task_done()
+            self._pending.discard(plan_id)
+            batch.add(plan_id)
+        return batch
+
+    async def _flush(self, batch: set[str]):
+        for plan_id in batch:
+            try:
+                metrics = await get_metrics(self.db, plan_id)
+                if metrics is not None:
+                    await self.service.send(metrics)
+            except Exception as e:
+                logger.info("failed to send metrics", plan=plan_id, error=str(e))
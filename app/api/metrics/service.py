@@ -1,10 +1,20 @@
-from fastapi import Request
 from fastapi.encoders import jsonable_encoder
 from starlette.status import HTTP_200_OK, HTTP_201_CREATED
-from app.config.config import METRICS_URL
-from app.config.database import REVIEWS_COLLECTION_NAME, TRAININGS_COLLECTION_NAME
+from app.config.config import (
+    METRICS_CONNECT_TIMEOUT,
+    METRICS_HTTP2,
+    METRICS_KEEPALIVE_EXPIRY,
+    METRICS_MAX_CONNECTIONS,
+    METRICS_MAX_KEEPALIVE_CONNECTIONS,
+    METRICS_READ_TIMEOUT,
+    METRICS_URL,
+)
+from app.config.database import TRAININGS_COLLECTION_NAME
+from app.api.monitoring.instruments import METRICS_PUSHES
+from app.api.reviews.crud import aggregate_review_stats
 from pydantic import BaseModel, Field
 from app.config.config import logger
+from motor.motor_asyncio import AsyncIOMotorDatabase
 import httpx
 
 
@@ -17,57 +27,69 @@ class Metrics(BaseModel):
 
 
 class MetricsService:
-    metrics: Metrics
-
-    def __init__(self, metrics: Metrics):
-        self.metrics = metrics
-
-    async def send(self):
-        url = f"{METRICS_URL}metrics/trainings/{self.metrics.plan_id}"
-
-        async with httpx.AsyncClient() as client:
-            metrics = {
-                "metric": {
-                    "metric_type": self.metrics.metric_type,
-                    "favourite_counter": self.metrics.favourite_counter,
-                    "review_counter": self.metrics.review_counter,
-                    "review_average": self.metrics.review_average,
-                }
-            }
-            logger.info(f"sendig metrics to {url}", metrics=metrics)
-            r = await client.put(url, json=jsonable_encoder(metrics))
-            if r.status_code not in [HTTP_200_OK, HTTP_201_CREATED]:
-                logger.info("failed to send metrics", status_code=r.status_code)
-
-
-async def get_metrics(r: Request, plan_id: str) -> Metrics | None:
-    db = r.app.mongodb
-    pipeline = [
-        {"$match": {"plan_id": plan_id}},
-        {
-            "$group": {
-                "_id": None,
-                "mean": {"$avg": "$score"},
-                "count": {"$sum": 1},
+    client: httpx.AsyncClient
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def send(self, metrics: Metrics):
+        url = f"{METRICS_URL}metrics/trainings/{metrics.plan_id}"
+
+        body = {
+            "metric": {
+                "metric_type": metrics.metric_type,
+                "favourite_counter": metrics.favourite_counter,
+                "review_counter": metrics.review_counter,
+                "review_average": metrics.review_average,
             }
-        },
-    ]
-    reviews_cursor = db[REVIEWS_COLLECTION_NAME].aggregate(pipeline)
-    reviews_counter = 0
-    review_average = 0.0
-    async for review in reviews_cursor:
-        reviews_counter = review["count"]
-        review_average = review["mean"]
-
-    plan = await db[TRAININGS_COLLECTION_NAME].find_one({"_id": plan_id})
+        }
+        logger.info("sending metrics", url=url, metrics=body)
+        try:
+            r = await self.client.put(url, json=jsonable_encoder(body))
+        except Exception:
+            METRICS_PUSHES.labels("failure").inc()
+            raise
+
+        if r.status_code not in [HTTP_200_OK, HTTP_201_CREATED]:
+            logger.info("failed to send metrics", status_code=r.status_code)
+            METRICS_PUSHES.labels("failure").inc()
+            return
+
+        METRICS_PUSHES.labels("success").inc()
+
+
+def build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=METRICS_MAX_CONNECTIONS,
+        max_keepalive_connections=METRICS_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=METRICS_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(METRICS_READ_TIMEOUT, connect=METRICS_CONNECT_TIMEOUT)
+
+    # httpx raises at startup if h2, which comes with httpx[http2], is missing
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=METRICS_HTTP2)
+
+
+async def get_metrics(db: AsyncIOMotorDatabase, plan_id: str) -> Metrics | None:
+    plan = await db[TRAININGS_COLLECTION_NAME].find_one(
+        {"_id": plan_id},
+        {"favourite_count": 1, "review_count": 1, "review_score_sum": 1},
+    )
     if plan is None:
         logger.info("failed to retrieve metrics", error=f"plan {plan_id} not found")
         return None
 
-    favourite_counter = len(plan["favourited_by"])
+    if "review_count" in plan:
+        reviews_counter = plan["review_count"]
+        review_average = 0.0
+        if reviews_counter > 0:
+            review_average = plan["review_score_sum"] / reviews_counter
+    else:
+        reviews_counter, review_average = await aggregate_review_stats(db, plan_id)
+
     return Metrics(
         plan_id=plan_id,
-        favourite_counter=favourite_counter,
+        favourite_counter=plan.get("favourite_count", 0),
         review_counter=reviews_counter,
         review_average=review_average,
     )
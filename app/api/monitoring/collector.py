@@ -0,0 +1,66 @@
+import structlog
+from fastapi import FastAPI
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+CACHES = {"entity": "entity_cache", "listing": "listing_cache"}
+
+
+class AppCollector(Collector):
+    """Reads the state of the in-process caches and queues on each scrape,
+    so keeping it exported costs nothing on the request path"""
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+
+    def collect(self):
+        entries = GaugeMetricFamily(
+            "cache_entries", "Entries held, by cache", labels=["cache"]
+        )
+        size = GaugeMetricFamily(
+            "cache_bytes", "Estimated size of the entries, by cache", labels=["cache"]
+        )
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        evictions = CounterMetricFamily(
+            "cache_evictions", "Entries evicted to make room", labels=["cache"]
+        )
+        for name, attribute in CACHES.items():
+            cache = getattr(self.app, attribute, None)
+            if cache is None:
+                continue
+            entries.add_metric([name], len(cache))
+            size.add_metric([name], cache.size)
+            hits.add_metric([name], cache.stats.hits)
+            misses.add_metric([name], cache.stats.misses)
+            evictions.add_metric([name], cache.stats.evictions)
+        yield from [entries, size, hits, misses, evictions]
+
+        singleflight = getattr(self.app, "singleflight", None)
+        if singleflight is not None:
+            yield GaugeMetricFamily(
+                "singleflight_calls_in_flight",
+                "Loads being shared by concurrent callers",
+                value=len(singleflight),
+            )
+            yield CounterMetricFamily(
+                "singleflight_collapsed",
+                "Callers that awaited a load already in flight",
+                value=singleflight.collapsed,
+            )
+
+        dispatcher = getattr(self.app, "metrics_dispatcher", None)
+        if dispatcher is not None:
+            yield GaugeMetricFamily(
+                "metrics_queue_size",
+                "Plan metrics updates waiting to be sent",
+                value=dispatcher.queue_size(),
+            )
+
+        writer = getattr(structlog.get_config()["logger_factory"], "writer", None)
+        if writer is not None:
+            yield CounterMetricFamily(
+                "log_lines_dropped",
+                "Log lines dropped because the writer fell behind",
+                value=writer.dropped,
+            )
@@ -0,0 +1,39 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Requests handled, by route template and status code",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, by route template",
+    ["method", "route"],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Requests being handled, by route template",
+    ["method", "route"],
+)
+
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds",
+    "Time the database took to run a command, by collection and command",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total",
+    "Commands the database failed to run, by collection and command",
+    ["collection", "command"],
+)
+
+METRICS_PUSHES = Counter(
+    "metrics_pushes_total",
+    "Plan metrics sent to the metrics service, by result",
+    ["result"],
+)
+METRICS_UPDATES_DROPPED = Counter(
+    "metrics_updates_dropped_total",
+    "Plan metrics updates dropped because the queue was full",
+)
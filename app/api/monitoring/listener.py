@@ -0,0 +1,44 @@
+from pymongo import monitoring
+from app.api.monitoring.instruments import (
+    MONGO_COMMAND_DURATION,
+    MONGO_COMMAND_FAILURES,
+)
+
+
+def command_collection(event: monitoring.CommandStartedEvent) -> str:
+    """Collection a command runs on, empty for database commands"""
+    command = event.command
+    if event.command_name == "getMore":
+        return command.get("collection", "")
+
+    collection = command.get(event.command_name)
+    return collection if isinstance(collection, str) else ""
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command sent through the client it's attached to.
+
+    Only the started event names the collection, so it's kept until the
+    command ends. Events come from the driver's threads; the dict operations
+    used are atomic and the instruments are thread safe.
+    """
+
+    def __init__(self):
+        self._collections: dict[tuple, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        key = (event.connection_id, event.request_id)
+        self._collections[key] = command_collection(event)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name).observe(
+            event.duration_micros / 1e6
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name).observe(
+            event.duration_micros / 1e6
+        )
+        MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
@@ -0,0 +1,115 @@
+import time
+from contextvars import ContextVar
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.api.monitoring.instruments import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    HTTP_REQUESTS_IN_PROGRESS,
+)
+
+# Label of the requests that match no route, so scans of random paths don't
+# create a series each
+UNMATCHED_ROUTE = "unmatched"
+
+# Method and route template of the request being handled, unset for the
+# background tasks
+current_route: ContextVar[str | None] = ContextVar("current_route", default=None)
+
+
+def first_segment(path: str) -> str:
+    return path.split("/", 2)[1] if path.startswith("/") else ""
+
+
+def group_routes(routes: list[BaseRoute]) -> dict[str, list[BaseRoute]]:
+    """Routes by the first segment of their path, so a request is only matched
+    against the ones that can match it. Routes starting with a parameter are
+    tried for every request, after the others."""
+    groups: dict[str, list[BaseRoute]] = {}
+    anywhere = []
+    for route in routes:
+        segment = first_segment(getattr(route, "path", ""))
+        if "{" in segment or not segment:
+            anywhere.append(route)
+        else:
+            groups.setdefault(segment, []).append(route)
+
+    return {segment: group + anywhere for segment, group in groups.items()} | {
+        "": anywhere
+    }
+
+
+def route_template(scope: Scope, groups: dict[str, list[BaseRoute]]) -> str:
+    """Path of the route the request is for, e.g. /plans/{plan_id}"""
+    routes = groups.get(first_segment(scope["path"]), groups[""])
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+
+    return partial or UNMATCHED_ROUTE
+
+
+class PrometheusMiddleware:
+    """Counts and times every request by its method and route template.
+
+    A plain ASGI middleware, rather than a BaseHTTPMiddleware, so it adds no
+    task or stream per request. The labelled children are kept, as looking
+    them up is the costly part of recording a sample. Routes are grouped on
+    the first request, once every router has been included.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._children: dict[tuple, tuple] = {}
+        self._counters: dict[tuple, object] = {}
+        self._routes: dict[str, list[BaseRoute]] | None = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self._routes is None:
+            self._routes = group_routes(scope["app"].router.routes)
+
+        method = scope["method"]
+        route = route_template(scope, self._routes)
+        current_route.set(f"{method} {route}")
+        key = (method, route)
+        children = self._children.get(key)
+        if children is None:
+            children = (
+                HTTP_REQUEST_DURATION.labels(method, route),
+                HTTP_REQUESTS_IN_PROGRESS.labels(method, route),
+            )
+            self._children[key] = children
+        duration, in_progress = children
+
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration.observe(time.perf_counter() - start)
+            in_progress.dec()
+            self._count(method, route, status)
+
+    def _count(self, method: str, route: str, status: int):
+        key = (method, route, status)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = HTTP_REQUESTS.labels(method, route, str(status))
+            self._counters[key] = counter
+        counter.inc()
@@ -0,0 +1,33 @@
+from pydantic import BaseModel, Field
+
+
+class SlowQueryShape(BaseModel):
+    collection: str = Field(...)
+    command: str = Field(...)
+    # The command's filter, sort, pipeline... with the values stripped
+    shape: str = Field(...)
+    count: int = Field(...)
+    failed: int = Field(...)
+    mean_ms: float = Field(...)
+    max_ms: float = Field(...)
+    # Only known for some commands
+    max_docs_examined: int | None = Field(default=None)
+    max_docs_returned: int | None = Field(default=None)
+    # Routes the command was sent from, empty for background tasks
+    routes: list[str] = Field(default_factory=list)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "collection": "trainings",
+                "command": "find",
+                "shape": '{"filter": {"blocked": "?", "training_types": {"$in": "?"}}}',
+                "count": 12,
+                "failed": 0,
+                "mean_ms": 180.5,
+                "max_ms": 420.1,
+                "max_docs_examined": None,
+                "max_docs_returned": 25,
+                "routes": ["GET /plans"],
+            }
+        }
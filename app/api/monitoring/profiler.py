@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping
+from typing import Any
+from pymongo import monitoring
+from app.api.monitoring.listener import command_collection
+from app.api.monitoring.middleware import current_route
+from app.config.config import logger
+
+# Parts of each command that make up its shape
+SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort", "update"),
+    "insert": ("documents",),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+
+# Fields whose first statement stands for the rest, as the statements of a
+# bulk write usually share their shape
+STATEMENTS = {"documents", "updates", "deletes"}
+
+# Keys of the update and delete statements that make up their shape
+STATEMENT_FIELDS = ("q", "u", "limit", "multi", "upsert")
+
+# Sorts are kept as they are, their directions pick the index
+SORT_FIELDS = {"sort", "$sort"}
+
+# Cursors left open are forgotten past this many, oldest first
+MAX_OPEN_CURSORS = 1024
+
+
+def value_shape(value: Any) -> Any:
+    """The value with every literal replaced by "?", keeping the field names,
+    operators and sorts. Lists of literals, like the ones given to $in,
+    collapse into a single "?" so their length doesn't make a new shape."""
+    if isinstance(value, Mapping):
+        return {
+            key: item if key in SORT_FIELDS else value_shape(item)
+            for key, item in value.items()
+        }
+
+    if isinstance(value, list) and any(
+        isinstance(item, (Mapping, list)) for item in value
+    ):
+        return [value_shape(item) for item in value]
+
+    return "?"
+
+
+def command_shape(command_name: str, command: Mapping) -> str:
+    shape = {}
+    for field in SHAPE_FIELDS.get(command_name, ()):
+        if field not in command:
+            continue
+        value = command[field]
+        if field in STATEMENTS and value:
+            value = value[0]
+            if field != "documents":
+                value = {key: value[key] for key in STATEMENT_FIELDS if key in value}
+        shape[field] = value_shape({field: value})[field]
+
+    return json.dumps(shape, default=str)
+
+
+def documents_returned(reply: Mapping) -> int | None:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, Mapping):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        if batch is not None:
+            return len(batch)
+    n = reply.get("n")
+    return n if isinstance(n, int) else None
+
+
+def documents_examined(reply: Mapping) -> int | None:
+    # Only explain replies carry it, the server doesn't report it otherwise
+    stats = reply.get("executionStats")
+    if isinstance(stats, Mapping):
+        return stats.get("totalDocsExamined")
+    return None
+
+
+class SlowQueryProfiler(monitoring.CommandListener):
+    """Logs the commands that take longer than threshold_ms and keeps them for
+    the window, to rank their shapes by how slow they were.
+
+    Started events only keep a reference to the command; its shape is only
+    worked out for the slow ones. A getMore takes the shape of the command
+    that opened its cursor, which is kept by cursor id until the cursor is
+    exhausted or killed. The entries are bounded by max_entries, the oldest
+    go first.
+    """
+
+    def __init__(self, threshold_ms: float, window: float, max_entries: int):
+        self.threshold_ms = threshold_ms
+        self.window = window
+        self._started: dict[tuple, tuple] = {}
+        self._cursors: dict[int, tuple[str, Mapping]] = {}
+        self._entries: deque[tuple[float, dict]] = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        key = (event.connection_id, event.request_id)
+        self._started[key] = (event, current_route.get())
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._ended(event, event.reply, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._ended(event, {}, failed=True)
+
+    def _ended(self, event, reply: Mapping, failed: bool):
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+
+        started_event, route = started
+        command_name, command = self._cursor_origin(started_event, reply)
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        entry = {
+            "collection": command_collection(started_event),
+            "command": event.command_name,
+            "shape": command_shape(command_name, command),
+            "duration_ms": duration_ms,
+            "docs_examined": documents_examined(reply),
+            "docs_returned": documents_returned(reply),
+            "route": route,
+            "failed": failed,
+        }
+        logger.info("slow database command", **entry)
+        with self._lock:
+            self._entries.append((time.monotonic(), entry))
+
+    def _cursor_origin(
+        self, event: monitoring.CommandStartedEvent, reply: Mapping
+    ) -> tuple[str, Mapping]:
+        """Name and body of the command that opened the cursor the event reads
+        from, the event's own unless it's a getMore"""
+        origin = (event.command_name, event.command)
+        with self._lock:
+            if event.command_name == "getMore":
+                origin = self._cursors.pop(event.command["getMore"], origin)
+            elif event.command_name == "killCursors":
+                for cursor_id in event.command.get("cursors", ()):
+                    self._cursors.pop(cursor_id, None)
+
+            cursor = reply.get("cursor")
+            if isinstance(cursor, Mapping) and cursor.get("id"):
+                self._cursors[cursor["id"]] = origin
+                if len(self._cursors) > MAX_OPEN_CURSORS:
+                    del self._cursors[next(iter(self._cursors))]
+        return origin
+
+    def top(self, limit: int) -> list[dict]:
+        """Shapes of the slow commands within the window, slowest first"""
+        since = time.monotonic() - self.window
+        with self._lock:
+            while self._entries and self._entries[0][0] < since:
+                self._entries.popleft()
+            entries = [entry for _, entry in self._entries]
+
+        shapes: dict[tuple, dict] = {}
+        for entry in entries:
+            key = (entry["collection"], entry["command"], entry["shape"])
+            shape = shapes.get(key)
+            if shape is None:
+                shape = shapes[key] = {
+                    "collection": entry["collection"],
+                    "command": entry["command"],
+                    "shape": entry["shape"],
+                    "count": 0,
+                    "failed": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "max_docs_examined": None,
+                    "max_docs_returned": None,
+                    "routes": [],
+                }
+            shape["count"] += 1
+            shape["failed"] += entry["failed"]
+            shape["total_ms"] += entry["duration_ms"]
+            shape["max_ms"] = max(shape["max_ms"], entry["duration_ms"])
+            for field in ("docs_examined", "docs_returned"):
+                if entry[field] is not None:
+                    current = shape[f"max_{field}"]
+                    shape[f"max_{field}"] = max(current or 0, entry[field])
+            if entry["route"] is not None and entry["route"] not in shape["routes"]:
+                shape["routes"].append(entry["route"])
+
+        ranked = sorted(shapes.values(), key=lambda shape: -shape["max_ms"])
+        for shape in ranked:
+            shape["mean_ms"] = shape.pop("total_ms") / shape["count"]
+        return ranked[:limit]
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from app.api.monitoring.models import SlowQueryShape
+from app.api.pagination import page_size
+
+router = APIRouter(tags=["monitoring"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus exposition of the service's metrics"""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/admin/slow-queries", response_model=list[SlowQueryShape])
+async def get_slow_queries(request: Request, limit: int = 10):
+    """Shapes of the database commands over the slow query threshold within
+    the window, slowest first"""
+    return request.app.slow_query_profiler.top(page_size(limit))
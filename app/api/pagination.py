@@ -0,0 +1,45 @@
+import base64
+import binascii
+import json
+from fastapi import HTTPException, Response, status
+from app.config.config import MAX_PAGE_SIZE
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def page_size(limit: int) -> int:
+    if limit <= 0:
+        return MAX_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(position: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str | None, keys: tuple = ("_id",)) -> dict | None:
+    if cursor is None:
+        return None
+
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        position = None
+
+    if not isinstance(position, dict) or any(key not in position for key in keys):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor {cursor}"
+        )
+    return position
+
+
+def next_cursor(items: list[dict], limit: int, keys: tuple = ("_id",)) -> str | None:
+    """Cursor pointing after the last item, None when there are no more pages"""
+    if len(items) < limit:
+        return None
+    return encode_cursor({key: items[-1][key] for key in keys})
+
+
+def set_next_cursor(response: Response, cursor: str | None):
+    if cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
@@ -0,0 +1,24 @@
+from fastapi import Request
+from app.api.trainers.crud import get_plans_by_id
+from app.config.config import RECOMMENDATIONS_OVERFETCH
+from app.config.database import FAVOURITES_COLLECTION_NAME
+
+
+async def get_recommendations(r: Request, user_id: str, limit: int) -> list[dict]:
+    """Plans like the ones the user favourited, best match first"""
+    db = r.app.mongodb
+    refresher = r.app.plan_index_refresher
+    if refresher.index is None:
+        await refresher.build()
+
+    liked = [
+        favourite["plan_id"]
+        async for favourite in db[FAVOURITES_COLLECTION_NAME].find(
+            {"user_id": user_id}, {"_id": 0, "plan_id": 1}
+        )
+    ]
+    # Asks for more than needed, as plans blocked or deleted since the index
+    # was last refreshed are dropped
+    plan_ids = refresher.index.recommend(liked, limit * RECOMMENDATIONS_OVERFETCH)
+    plans, _ = await get_plans_by_id(r, plan_ids)
+    return [plan for plan in plans if not plan["blocked"]][:limit]
@@ -0,0 +1,136 @@
+import numpy as np
+from app.api.trainers.models import Difficulty
+from app.config.config import (
+    RECOMMENDATIONS_DURATION_WEIGHT,
+    RECOMMENDATIONS_POPULARITY_WEIGHT,
+)
+
+DIFFICULTIES = {
+    difficulty.value: column for column, difficulty in enumerate(Difficulty)
+}
+
+# Fields of a plan the index is built from
+INDEX_FIELDS = {
+    "difficulty": 1,
+    "training_types": 1,
+    "duration": 1,
+    "favourite_count": 1,
+    "blocked": 1,
+    "updated_at": 1,
+}
+
+
+class PlanIndex:
+    """Features of every plan, one row per plan, to score them all at once.
+
+    Each row holds the difficulty one-hot, followed by one column per training
+    type scaled so the types of a plan have unit norm, plus the log of the
+    duration and of the favourites in their own arrays. Rows are written in
+    place as plans change and the arrays double when they run out of room;
+    rows of deleted or blocked plans are only marked inactive and reused.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.rows: dict[str, int] = {}
+        self.types: dict[str, int] = {}
+        self._ids: list[str | None] = []
+        self._free: list[int] = []
+        self._features = np.zeros((capacity, len(DIFFICULTIES) + 8), np.float32)
+        self._duration = np.zeros(capacity, np.float32)
+        self._popularity = np.zeros(capacity, np.float32)
+        self._active = np.zeros(capacity, bool)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def upsert(self, plan: dict):
+        if plan.get("blocked"):
+            self.remove(plan["_id"])
+            return
+
+        row = self.rows.get(plan["_id"])
+        if row is None:
+            row = self._new_row(plan["_id"])
+
+        types = set(plan["training_types"])
+        columns = [self._type_column(training_type) for training_type in types]
+        features = self._features[row]
+        features[:] = 0
+        features[DIFFICULTIES[plan["difficulty"]]] = 1
+        if columns:
+            features[columns] = 1 / np.sqrt(len(columns))
+        self._duration[row] = np.log1p(plan["duration"])
+        self._popularity[row] = np.log1p(max(plan.get("favourite_count", 0), 0))
+        self._active[row] = True
+
+    def remove(self, plan_id: str):
+        row = self.rows.pop(plan_id, None)
+        if row is not None:
+            self._ids[row] = None
+            self._active[row] = False
+            self._free.append(row)
+
+    def recommend(self, liked: list[str], k: int) -> list[str]:
+        """Ids of the k active plans most similar to the liked ones, best first.
+
+        The profile is the mean of the liked plans' rows, so every plan is
+        scored with a single matrix-vector product plus how close its duration
+        is to the liked ones. Popularity breaks ties and is all there is to go
+        on for users that haven't liked anything yet. Liked plans are never
+        recommended.
+        """
+        size = len(self._ids)
+        liked_rows = [self.rows[plan_id] for plan_id in liked if plan_id in self.rows]
+        features = self._features[:size]
+        popularity = self._popularity[:size]
+
+        scores = (
+            RECOMMENDATIONS_POPULARITY_WEIGHT
+            * popularity
+            / max(popularity.max(initial=0), 1)
+        )
+        if liked_rows:
+            scores += features @ features[liked_rows].mean(axis=0)
+            duration = self._duration[:size]
+            distance = np.abs(duration - duration[liked_rows].mean())
+            scores += RECOMMENDATIONS_DURATION_WEIGHT * np.exp(-distance)
+
+        scores[~self._active[:size]] = -np.inf
+        scores[liked_rows] = -np.inf
+
+        candidates = min(k, len(self.rows) - len(liked_rows))
+        if candidates <= 0:
+            return []
+
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self._ids[row] for row in top if np.isfinite(scores[row])]
+
+    def _new_row(self, plan_id: str) -> int:
+        if self._free:
+            row = self._free.pop()
+            self._ids[row] = plan_id
+        else:
+            row = len(self._ids)
+            if row == len(self._active):
+                self._grow_rows()
+            self._ids.append(plan_id)
+
+        self.rows[plan_id] = row
+        return row
+
+    def _type_column(self, training_type: str) -> int:
+        column = self.types.get(training_type)
+        if column is None:
+            column = len(DIFFICULTIES) + len(self.types)
+            if column == self._features.shape[1]:
+                self._features = np.pad(self._features, ((0, 0), (0, len(self.types))))
+            self.types[training_type] = column
+        return column
+
+    def _grow_rows(self):
+        capacity = len(self._active)
+        self._features = np.pad(self._features, ((0, capacity), (0, 0)))
+        self._duration = np.pad(self._duration, (0, capacity))
+        self._popularity = np.pad(self._popularity, (0, capacity))
+        self._active = np.pad(self._active, (0, capacity))
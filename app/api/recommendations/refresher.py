@@ -0,0 +1,136 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.api.recommendations.index import INDEX_FIELDS, PlanIndex
+from app.api.singleflight import SingleFlight
+from app.config.config import logger
+from app.config.database import TRAININGS_COLLECTION_NAME
+
+
+class PlanIndexRefresher:
+    """Keeps the plan index of this process up to date in the background.
+
+    Every interval the plans written since the last refresh, by this process
+    or any other, are read again and their rows rewritten. The read starts
+    overlap seconds before the last write time seen, as a write stamped
+    earlier may only become visible after a later one was read. Plans this
+    process deleted are marked, as they can't be found by their write time
+    anymore, and every rebuild_interval the index is built again from scratch,
+    which also drops the plans other processes deleted.
+
+    Builds go through the singleflight, so requests that find no index yet
+    wait for the one being built instead of starting their own.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        singleflight: SingleFlight,
+        interval: float,
+        rebuild_interval: float,
+        overlap: float,
+    ):
+        self.db = db
+        self.singleflight = singleflight
+        self.interval = interval
+        self.rebuild_interval = rebuild_interval
+        self.overlap = timedelta(seconds=overlap)
+        self.index: PlanIndex | None = None
+        self._since: datetime | None = None
+        self._dirty: set[str] = set()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def mark(self, plan_id: str):
+        self._dirty.add(plan_id)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def build(self):
+        await self.singleflight.do(("plan_index",), self.rebuild)
+
+    async def rebuild(self):
+        # Plans marked from here on are refreshed after the scan, as it may
+        # have already gone past them
+        dirty = self._dirty
+        self._dirty = set()
+        index = PlanIndex()
+        since = None
+        try:
+            async for plan in self.db[TRAININGS_COLLECTION_NAME].find(
+                {"blocked": False}, INDEX_FIELDS
+            ):
+                index.upsert(plan)
+                since = max_updated_at(since, plan)
+        except Exception:
+            self._dirty.update(dirty)
+            raise
+
+        self.index = index
+        self._since = since
+        logger.info("built plan index", plans=len(index))
+
+    async def refresh(self):
+        if self.index is None:
+            return
+
+        dirty = list(self._dirty)
+        self._dirty = set()
+        query = {"_id": {"$in": dirty}}
+        if self._since is not None:
+            # Write times come from the database clock, so are compared with
+            # the last one seen rather than ours
+            query = {
+                "$or": [query, {"updated_at": {"$gte": self._since - self.overlap}}]
+            }
+
+        since = self._since
+        found = set()
+        try:
+            async for plan in self.db[TRAININGS_COLLECTION_NAME].find(
+                query, INDEX_FIELDS
+            ):
+                self.index.upsert(plan)
+                since = max_updated_at(since, plan)
+                found.add(plan["_id"])
+        except Exception as e:
+            logger.info("failed to refresh plan index", error=str(e))
+            self._dirty.update(dirty)
+            return
+
+        self._since = since
+        for plan_id in set(dirty) - found:
+            self.index.remove(plan_id)
+
+    async def _run(self):
+        last_rebuild = None
+        while True:
+            if last_rebuild is None or (
+                time.monotonic() - last_rebuild >= self.rebuild_interval
+            ):
+                try:
+                    await self.build()
+                    last_rebuild = time.monotonic()
+                except Exception as e:
+                    logger.info("failed to build plan index", error=str(e))
+            else:
+                await self.refresh()
+
+            await asyncio.sleep(self.interval)
+
+
+def max_updated_at(since: datetime | None, plan: dict) -> datetime | None:
+    updated_at = plan.get("updated_at")
+    if updated_at is None or (since is not None and since >= updated_at):
+        return since
+    return updated_at
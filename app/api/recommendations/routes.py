@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Request
+from app.api.pagination import page_size
+from app.api.recommendations import crud
+from app.api.responses import TrustedJSONResponse
+from app.api.trainers.models import TrainingPlan, plan_view
+
+router = APIRouter(tags=["recommendations"])
+
+
+@router.get("/users/{user_id}/recommendations", response_model=list[TrainingPlan])
+async def get_recommendations(user_id: str, request: Request, limit: int = 10):
+    """Unblocked plans the user hasn't favourited yet, most similar to the ones
+    they did first. Users without favourites get the most popular plans"""
+    plans = await crud.get_recommendations(request, user_id, page_size(limit))
+    return TrustedJSONResponse(content=[plan_view(plan) for plan in plans])
@@ -0,0 +1,20 @@
+from typing import Any
+import orjson
+from fastapi.responses import Response
+
+
+class TrustedJSONResponse(Response):
+    """Renders the content with orjson, skipping the route's response_model.
+
+    FastAPI validates whatever a route returns against its response_model and
+    runs it through jsonable_encoder before rendering it, which for documents
+    read from our own collections is pure overhead. Returning this response
+    skips both, while the response_model still documents the route. It's only
+    meant for documents this service wrote, already shaped like the model;
+    orjson handles the UUIDs, enums and datetimes they may hold.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
@@ -1,58 +1,160 @@
 from app.api.reviews.models import (
+    MAX_SCORE,
+    MIN_SCORE,
     Review,
     ReviewAverageScoreResponse,
     ReviewResponse,
+    ReviewStats,
     UpdateReview,
 )
 from app.config.database import REVIEWS_COLLECTION_NAME, TRAININGS_COLLECTION_NAME
 from fastapi.encoders import jsonable_encoder
 from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from app.api.invalidation import plan_changed, review_stats_key
+from app.api.pagination import next_cursor
 
 
 async def create_review(r: Request, review: Review) -> Review | None:
     db = r.app.mongodb
-    existing_review = await db[REVIEWS_COLLECTION_NAME].find_one(
-        {"$and": [{"plan_id": review.plan_id}, {"user_id": review.user_id}]}
-    )
-    if existing_review is None:
-        review = jsonable_encoder(review)
-        new_review = await db[REVIEWS_COLLECTION_NAME].insert_one(review)
-        created_review = await db[REVIEWS_COLLECTION_NAME].find_one(
-            {"_id": new_review.inserted_id}
+    review = jsonable_encoder(review)
+    try:
+        await db[REVIEWS_COLLECTION_NAME].update_one(
+            {"_id": review["_id"]},
+            {"$setOnInsert": review, "$currentDate": {"updated_at": True}},
+            upsert=True,
         )
-
-        return created_review
-
-    return None
+    except DuplicateKeyError:
+        return None
+
+    await db[TRAININGS_COLLECTION_NAME].update_one(
+        {"_id": review["plan_id"]},
+        {
+            "$inc": {
+                "review_count": 1,
+                "review_score_sum": review["score"],
+                "reviews_version": 1,
+            },
+            "$currentDate": {"updated_at": True},
+        },
+    )
+    plan_changed(r.app, review["plan_id"])
+    return review
 
 
 async def get_reviews(
-    r: Request, plan_id: str, skip: int, limit: int
+    r: Request, plan_id: str, skip: int, limit: int, after: dict | None = None
 ) -> ReviewResponse:
     db = r.app.mongodb
+    query = {"plan_id": plan_id}
+    if after is not None:
+        query["_id"] = {"$gt": after["_id"]}
+
     reviews = [
         plan
         async for plan in db[REVIEWS_COLLECTION_NAME].find(
-            filter={"plan_id": plan_id}, skip=skip, limit=limit
+            filter=query, skip=skip, limit=limit, sort=[("_id", ASCENDING)]
         )
     ]
 
-    return ReviewResponse(reviews=reviews)
+    return ReviewResponse(reviews=reviews, next_cursor=next_cursor(reviews, limit))
 
 
-async def get_average_score(r: Request, plan_id: str) -> ReviewAverageScoreResponse:
+async def get_reviews_version(r: Request, plan_id: str) -> int | None:
+    """Version of the plan's reviews, bumped by every review write"""
     db = r.app.mongodb
+    plan = await db[TRAININGS_COLLECTION_NAME].find_one(
+        {"_id": plan_id}, {"reviews_version": 1}
+    )
+    if plan is None:
+        return None
+
+    return plan.get("reviews_version", 0)
+
+
+async def aggregate_review_stats(
+    db: AsyncIOMotorDatabase, plan_id: str
+) -> tuple[int, float]:
     pipeline = [
         {"$match": {"plan_id": plan_id}},
-        {"$group": {"_id": None, "mean": {"$avg": "$score"}}},
+        {"$group": {"_id": None, "mean": {"$avg": "$score"}, "count": {"$sum": 1}}},
     ]
 
     cursor = db[REVIEWS_COLLECTION_NAME].aggregate(pipeline)
-    current_score = 0
-    async for score in cursor:
-        current_score = score["mean"]
+    count = 0
+    mean = 0.0
+    async for stats in cursor:
+        count = stats["count"]
+        mean = stats["mean"]
+
+    return count, mean
+
+
+async def get_average_score(r: Request, plan_id: str) -> ReviewAverageScoreResponse:
+    cache = r.app.entity_cache
+    key = review_stats_key(plan_id)
+    mean = cache.get(key)
+    if mean is None:
+        epoch = cache.epoch(key)
+
+        async def load():
+            mean = await _get_average_score(r.app.mongodb, plan_id)
+            cache.set(key, mean, epoch)
+            return mean
 
-    return ReviewAverageScoreResponse(mean=current_score)
+        mean = await r.app.singleflight.do((key, epoch), load)
+
+    return ReviewAverageScoreResponse(mean=mean)
+
+
+async def _get_average_score(db: AsyncIOMotorDatabase, plan_id: str) -> float:
+    plan = await db[TRAININGS_COLLECTION_NAME].find_one(
+        {"_id": plan_id}, {"review_count": 1, "review_score_sum": 1}
+    )
+
+    # Reviews of unknown plans, or of plans whose counters weren't backfilled
+    # yet, still have to be aggregated
+    if plan is None or "review_count" not in plan:
+        _, mean = await aggregate_review_stats(db, plan_id)
+        return mean
+
+    if plan["review_count"] == 0:
+        return 0
+
+    return plan["review_score_sum"] / plan["review_count"]
+
+
+async def get_review_stats(r: Request, plan_ids: list[str]) -> list[ReviewStats]:
+    """Mean, count and score histogram of each plan, from a single aggregation"""
+    db = r.app.mongodb
+    plan_ids = list(dict.fromkeys(plan_ids))
+    histograms = {
+        plan_id: {score: 0 for score in range(MIN_SCORE, MAX_SCORE + 1)}
+        for plan_id in plan_ids
+    }
+    pipeline = [
+        {"$match": {"plan_id": {"$in": plan_ids}}},
+        {
+            "$group": {
+                "_id": {"plan_id": "$plan_id", "score": "$score"},
+                "count": {"$sum": 1},
+            }
+        },
+    ]
+    async for group in db[REVIEWS_COLLECTION_NAME].aggregate(pipeline):
+        histograms[group["_id"]["plan_id"]][group["_id"]["score"]] = group["count"]
+
+    stats = []
+    for plan_id, histogram in histograms.items():
+        count = sum(histogram.values())
+        total = sum(score * n for score, n in histogram.items())
+        mean = total / count if count else 0
+        stats.append(
+            ReviewStats(plan_id=plan_id, mean=mean, count=count, histogram=histogram)
+        )
+    return stats
 
 
 async def update_review(
@@ -62,17 +164,25 @@ async def update_review(
     updated_review = {k: v for k, v in review.dict().items() if v is not None}
 
     if len(updated_review) > 0:
-        result = await db[REVIEWS_COLLECTION_NAME].update_one(
-            {"_id": review_id}, {"$set": updated_review}
+        previous_review = await db[REVIEWS_COLLECTION_NAME].find_one_and_update(
+            {"_id": review_id},
+            {"$set": updated_review, "$currentDate": {"updated_at": True}},
         )
+        if previous_review is None:
+            return None
+
+        previous_score = previous_review["score"]
+        delta = updated_review.get("score", previous_score) - previous_score
+        await db[TRAININGS_COLLECTION_NAME].update_one(
+            {"_id": previous_review["plan_id"]},
+            {
+                "$inc": {"review_score_sum": delta, "reviews_version": 1},
+                "$currentDate": {"updated_at": True},
+            },
+        )
+        plan_changed(r.app, previous_review["plan_id"])
 
-        if result.modified_count == 1:
-            updated_review = await db[TRAININGS_COLLECTION_NAME].find_one(
-                {"_id": review_id}
-            )
-
-            if updated_review is not None:
-                return updated_review
+        return {**previous_review, **updated_review}
 
     current_review = await db[REVIEWS_COLLECTION_NAME].find_one({"_id": review_id})
 
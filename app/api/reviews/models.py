@@ -1,7 +1,10 @@
 from pydantic import BaseModel, Field
 from uuid import uuid4
+from app.config.config import MAX_PAGE_SIZE
 
 REVIEW_MAX_LENGTH = 240
+MIN_SCORE = 1
+MAX_SCORE = 5
 
 
 class Review(BaseModel):
@@ -9,7 +12,7 @@ class Review(BaseModel):
     plan_id: str = Field(...)
     user_id: str = Field(...)
     review: str | None = Field(default=None, max_length=REVIEW_MAX_LENGTH)
-    score: int = Field(..., gt=0, le=5)
+    score: int = Field(..., ge=MIN_SCORE, le=MAX_SCORE)
 
     class Config:
         allow_population_by_field_name = True
@@ -25,6 +28,7 @@ class Review(BaseModel):
 
 class ReviewResponse(BaseModel):
     reviews: list[Review]
+    next_cursor: str | None = Field(default=None)
 
     class Config:
         schema_extra = {
@@ -42,7 +46,8 @@ class ReviewResponse(BaseModel):
                         "review": "Another review",
                         "score": 3,
                     },
-                ]
+                ],
+                "next_cursor": "eyJfaWQiOiAiYzU5NzEwZWYifQ==",
             }
         }
 
@@ -60,7 +65,7 @@ class ReviewAverageScoreResponse(BaseModel):
 
 class UpdateReview(BaseModel):
     review: str | None = Field(default=None, max_length=REVIEW_MAX_LENGTH)
-    score: int | None = Field(..., gt=0, le=5)
+    score: int | None = Field(..., ge=MIN_SCORE, le=MAX_SCORE)
 
     class Config:
         allow_population_by_field_name = True
@@ -70,3 +75,43 @@ class UpdateReview(BaseModel):
                 "score": 5,
             }
         }
+
+
+class BatchReviewStats(BaseModel):
+    plan_ids: list[str] = Field(..., max_items=MAX_PAGE_SIZE)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "plan_ids": [
+                    "c59710ef-f5d0-41ba-a787-ad8eb739ef4c",
+                    "7ca0fa95-af47-40b4-8e39-2fae5ee2667a",
+                ]
+            }
+        }
+
+
+class ReviewStats(BaseModel):
+    plan_id: str = Field(...)
+    mean: float = Field(...)
+    count: int = Field(...)
+    # Number of reviews with each score
+    histogram: dict[int, int] = Field(...)
+
+
+class BatchReviewStatsResponse(BaseModel):
+    stats: list[ReviewStats]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "stats": [
+                    {
+                        "plan_id": "c59710ef-f5d0-41ba-a787-ad8eb739ef4c",
+                        "mean": 4.5,
+                        "count": 2,
+                        "histogram": {1: 0, 2: 0, 3: 0, 4: 1, 5: 1},
+                    }
+                ]
+            }
+        }
@@ -1,13 +1,16 @@
-from app.api.metrics.service import MetricsService, get_metrics
 from app.api.reviews.models import (
+    BatchReviewStats,
+    BatchReviewStatsResponse,
     Review,
     UpdateReview,
     ReviewResponse,
     ReviewAverageScoreResponse,
 )
-from fastapi import APIRouter, HTTPException, Request, status
+from fastapi import APIRouter, Header, HTTPException, Request, Response, status
 from fastapi.responses import JSONResponse
 from app.api.reviews import crud
+from app.api.etag import ETAG_HEADER, etag_matches, not_modified, reviews_etag
+from app.api.pagination import decode_cursor, page_size, set_next_cursor
 from app.config import config
 from app.config.config import logger
 
@@ -25,9 +28,7 @@ async def create_review(review: Review, request: Request):
         )
     logger.info("created review", plan=review.plan_id, user=review.user_id)
     if config.METRICS_URL is not None:
-        metrics = await get_metrics(request, review.plan_id)
-        if metrics is not None:
-            await MetricsService(metrics).send()
+        request.app.metrics_dispatcher.submit(review.plan_id)
 
     return JSONResponse(status_code=status.HTTP_201_CREATED, content=created_review)
 
@@ -39,9 +40,7 @@ async def update_review(review_id: str, review: UpdateReview, request: Request):
     if response is not None:
         logger.info("review updated", review=review_id)
         if config.METRICS_URL is not None:
-            metrics = await get_metrics(request, response["plan_id"])
-            if metrics is not None:
-                await MetricsService(metrics).send()
+            request.app.metrics_dispatcher.submit(response["plan_id"])
         return response
 
     logger.info("failed to update review", review=review_id)
@@ -50,6 +49,12 @@ async def update_review(review_id: str, review: UpdateReview, request: Request):
     )
 
 
+@router.post("/reviews:batchStats", response_model=BatchReviewStatsResponse)
+async def get_batch_review_stats(batch: BatchReviewStats, request: Request):
+    stats = await crud.get_review_stats(request, batch.plan_ids)
+    return BatchReviewStatsResponse(stats=stats)
+
+
 @router.get("/reviews/{plan_id}/mean", response_model=ReviewAverageScoreResponse)
 async def get_plan_average_score(
     plan_id: str,
@@ -62,8 +67,25 @@ async def get_plan_average_score(
 async def get_training_plan_reviews(
     plan_id: str,
     request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 25,
+    cursor: str | None = None,
+    if_none_match: str | None = Header(default=None),
 ):
-    content = await crud.get_reviews(request, plan_id, skip, limit)
+    limit = page_size(limit)
+    after = decode_cursor(cursor)
+    if after is not None:
+        skip = 0
+
+    # Read before the reviews, so a write in between only makes the ETag older
+    version = await crud.get_reviews_version(request, plan_id)
+    if version is not None:
+        etag = reviews_etag(plan_id, version, skip, limit, after)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers[ETAG_HEADER] = etag
+
+    content = await crud.get_reviews(request, plan_id, skip, limit, after)
+    set_next_cursor(response, content.next_cursor)
     return content
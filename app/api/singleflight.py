@@ -0,0 +1,41 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from functools import partial
+from typing import Any
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time.
+
+    Callers asking for a key that is already being loaded await the call in
+    flight instead of starting their own, and `collapsed` counts them. The call
+    is shielded, so a caller that gets cancelled doesn't cancel it for the rest,
+    and it's forgotten as soon as it finishes, so a failure is only seen by the
+    callers that were waiting on it and the next one tries again.
+    """
+
+    def __init__(self):
+        self.collapsed = 0
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(partial(self._done, key))
+        else:
+            self.collapsed += 1
+
+        return await asyncio.shield(call)
+
+    def _done(self, key: Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Every caller may have been cancelled, the error is still retrieved
+        # so it isn't reported as never retrieved
+        if not call.cancelled():
+            call.exception()
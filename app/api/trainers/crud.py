@@ -1,84 +1,265 @@
-from typing import Tuple
+from datetime import datetime, timezone
 from fastapi import Request
 from fastapi.encoders import jsonable_encoder
-from app.config.database import TRAININGS_COLLECTION_NAME
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.api.invalidation import catalog_changed, plan_changed, plan_key, plans_key
+from app.api.pagination import encode_cursor
+from app.config.config import SEARCH_FAVOURITES_BOOST, SEARCH_RATING_BOOST
+from app.config.database import FAVOURITES_COLLECTION_NAME, TRAININGS_COLLECTION_NAME
+from app.api.reviews.models import MAX_SCORE
 from app.api.trainers.models import (
+    BlockStatus,
     BlockTrainingPlan,
+    BlockTrainingPlanResult,
     Difficulty,
     TrainingPlan,
     UpdateFavourite,
     UpdateTrainingPlan,
 )
+from uuid import uuid4
+
+BLOCK_BATCH_SIZE = 1000
 
 
 async def create_plan(r: Request, plan: TrainingPlan) -> TrainingPlan:
     db = r.app.mongodb
     plan = jsonable_encoder(plan)
-    new_plan = await db[TRAININGS_COLLECTION_NAME].insert_one(plan)
-    created_plan = await db[TRAININGS_COLLECTION_NAME].find_one(
-        {"_id": new_plan.inserted_id}
+    plan["favourite_count"] = 0
+    plan["review_count"] = 0
+    plan["review_score_sum"] = 0
+    plan["version"] = 1
+    # Stamped by the database, as the readers of updated_at compare it with
+    # the other write times it gave out rather than with their own clock
+    await db[TRAININGS_COLLECTION_NAME].update_one(
+        {"_id": plan["_id"]},
+        {"$setOnInsert": plan, "$currentDate": {"updated_at": True}},
+        upsert=True,
     )
-    return created_plan
+    plan_changed(r.app, plan["_id"])
+    catalog_changed(r.app)
+    return plan
 
 
 async def update_plan(
-    r: Request, plan: UpdateTrainingPlan, plan_id: str
+    r: Request, plan: UpdateTrainingPlan, plan_id: str, version: int | None = None
 ) -> TrainingPlan | None:
+    """Updates the plan, only if it's still at the given version when there's one"""
     db = r.app.mongodb
+    query = {"_id": plan_id}
+    if version is not None:
+        # Plans created before versioning have no version, they're at version 0
+        query["version"] = version or None
+
     updated_plan = {k: v for k, v in plan.dict().items() if v is not None}
     if len(updated_plan) > 0:
-        result = await db[TRAININGS_COLLECTION_NAME].update_one(
-            {"_id": plan_id}, {"$set": updated_plan}
+        updated_plan = await db[TRAININGS_COLLECTION_NAME].find_one_and_update(
+            query,
+            {
+                "$set": updated_plan,
+                "$inc": {"version": 1},
+                "$currentDate": {"updated_at": True},
+            },
+            return_document=ReturnDocument.AFTER,
         )
+        if updated_plan is not None:
+            plan_changed(r.app, plan_id)
+            catalog_changed(r.app)
+        return updated_plan
 
-        if result.modified_count == 1:
-            updated_plan = await db[TRAININGS_COLLECTION_NAME].find_one(
-                {"_id": plan_id}
-            )
-            if updated_plan is not None:
-                return updated_plan
+    return await db[TRAININGS_COLLECTION_NAME].find_one(query)
 
-    current_plan = await db[TRAININGS_COLLECTION_NAME].find_one({"_id": plan_id})
-    if current_plan is not None:
-        return current_plan
 
-    return None
+async def block_plan(
+    r: Request, plans: list[BlockTrainingPlan]
+) -> list[BlockTrainingPlanResult]:
+    # The last entry for a plan wins, results keep the order of the request
+    wanted = {}
+    for plan in plans:
+        wanted.pop(plan.uid, None)
+        wanted[plan.uid] = plan.blocked
+
+    uids = list(wanted)
+    results = []
+    for start in range(0, len(uids), BLOCK_BATCH_SIZE):
+        end = start + BLOCK_BATCH_SIZE
+        batch = uids[start:end]
+        results += await _block_plans_batch(r, {uid: wanted[uid] for uid in batch})
+    return results
 
 
-async def block_plan(r: Request, plans: list[BlockTrainingPlan]) -> Tuple[str, bool]:
+async def _block_plans_batch(r: Request, wanted: dict[str, bool]) -> list:
     db = r.app.mongodb
-    for plan in plans:
-        result = await db[TRAININGS_COLLECTION_NAME].update_one(
-            {"_id": plan.uid}, {"$set": {"blocked": plan.blocked}}
+    current = {
+        plan["_id"]: plan.get("blocked")
+        async for plan in db[TRAININGS_COLLECTION_NAME].find(
+            {"_id": {"$in": list(wanted)}}, {"blocked": 1}
         )
-        # If it errs some user may be blocked
-        if result.modified_count == 0:
-            return (plan.uid, False)
-    return ("", True)
+    }
+
+    statuses = {}
+    to_update = []
+    for uid, blocked in wanted.items():
+        if uid not in current:
+            statuses[uid] = BlockStatus.not_found
+        elif current[uid] == blocked:
+            statuses[uid] = BlockStatus.unchanged
+        else:
+            statuses[uid] = BlockStatus.updated
+            to_update.append(uid)
+
+    if to_update:
+        requests = [
+            UpdateOne(
+                {"_id": uid},
+                {
+                    "$set": {"blocked": wanted[uid]},
+                    "$inc": {"version": 1},
+                    "$currentDate": {"updated_at": True},
+                },
+            )
+            for uid in to_update
+        ]
+        try:
+            await db[TRAININGS_COLLECTION_NAME].bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                statuses[to_update[error["index"]]] = BlockStatus.failed
+
+        for uid in to_update:
+            plan_changed(r.app, uid)
+        catalog_changed(r.app)
+
+    return [
+        BlockTrainingPlanResult(uid=uid, status=status)
+        for uid, status in statuses.items()
+    ]
 
 
 async def get_plan(r: Request, plan_id: str) -> TrainingPlan | None:
-    db = r.app.mongodb
-    plan = await db[TRAININGS_COLLECTION_NAME].find_one({"_id": plan_id})
-    return plan
+    cache = r.app.entity_cache
+    key = plan_key(plan_id)
+    plan = cache.get(key)
+    if plan is not None:
+        return plan
+
+    epoch = cache.epoch(key)
+
+    async def load():
+        db = r.app.mongodb
+        plan = await db[TRAININGS_COLLECTION_NAME].find_one({"_id": plan_id})
+        if plan is not None:
+            cache.set(key, plan, epoch)
+        return plan
+
+    # Loads started before a write must not be shared with callers that
+    # arrived after it
+    return await r.app.singleflight.do((key, epoch), load)
+
+
+async def get_plans_by_id(
+    r: Request, plan_ids: list[str]
+) -> tuple[list[TrainingPlan], list[str]]:
+    """Plans in the order of their ids, plus the ids that weren't found"""
+    cache = r.app.entity_cache
+    plan_ids = list(dict.fromkeys(plan_ids))
+    plans = {}
+    for plan_id in plan_ids:
+        plan = cache.get(plan_key(plan_id))
+        if plan is not None:
+            plans[plan_id] = plan
+
+    to_read = [plan_id for plan_id in plan_ids if plan_id not in plans]
+    if to_read:
+        db = r.app.mongodb
+        epochs = {plan_id: cache.epoch(plan_key(plan_id)) for plan_id in to_read}
+        async for plan in db[TRAININGS_COLLECTION_NAME].find({"_id": {"$in": to_read}}):
+            cache.set(plan_key(plan["_id"]), plan, epochs[plan["_id"]])
+            plans[plan["_id"]] = plan
+
+    found = [plans[plan_id] for plan_id in plan_ids if plan_id in plans]
+    missing = [plan_id for plan_id in plan_ids if plan_id not in plans]
+    return found, missing
+
+
+async def get_plan_version(
+    r: Request, plan_id: str, cached: bool = False
+) -> int | None:
+    """Current version of the plan. The cached copy is good enough to answer
+    If-None-Match, but If-Match needs the one in the database"""
+    plan = r.app.entity_cache.get(plan_key(plan_id)) if cached else None
+    if plan is None:
+        db = r.app.mongodb
+        plan = await db[TRAININGS_COLLECTION_NAME].find_one(
+            {"_id": plan_id}, {"version": 1}
+        )
+        if plan is None:
+            return None
+
+    return plan.get("version", 0)
 
 
 async def get_trainer_plans(
-    r: Request, trainer_id: str, admin: bool
+    r: Request,
+    trainer_id: str,
+    admin: bool,
+    limit: int,
+    after: dict | None = None,
+    projection: dict | None = None,
 ) -> list[TrainingPlan]:
+    """Plans of the trainer, projected ones always keep their version"""
+    if projection is not None:
+        projection = {**projection, "version": 1}
+
     db = r.app.mongodb
+    return [
+        plan
+        async for plan in db[TRAININGS_COLLECTION_NAME].find(
+            _trainer_plans_query(trainer_id, admin, after),
+            projection,
+            limit=limit,
+            sort=[("_id", ASCENDING)],
+        )
+    ]
+
+
+async def get_trainer_plan_versions(
+    r: Request, trainer_id: str, admin: bool, limit: int, after: dict | None = None
+) -> list[tuple[str, int]]:
+    db = r.app.mongodb
+    return [
+        (plan["_id"], plan.get("version", 0))
+        async for plan in db[TRAININGS_COLLECTION_NAME].find(
+            _trainer_plans_query(trainer_id, admin, after),
+            {"version": 1},
+            limit=limit,
+            sort=[("_id", ASCENDING)],
+        )
+    ]
+
+
+def _trainer_plans_query(trainer_id: str, admin: bool, after: dict | None) -> dict:
     filters = []
     if not admin:
         filters.append({"blocked": False})
 
-    query = None
+    if after is not None:
+        filters.append({"_id": {"$gt": after["_id"]}})
+
     if filters:
         filters.append({"trainer": trainer_id})
-        query = {"$and": filters}
-    else:
-        query = {"trainer": trainer_id}
+        return {"$and": filters}
+
+    return {"trainer": trainer_id}
+
 
-    return [plan async for plan in db[TRAININGS_COLLECTION_NAME].find(query)]
+def new_favourite(user_id: str, plan_id: str) -> dict:
+    return {
+        "_id": str(uuid4()),
+        "user_id": user_id,
+        "plan_id": plan_id,
+        "created_at": datetime.now(timezone.utc),
+    }
 
 
 async def get_user_favourite_plans(
@@ -86,51 +267,96 @@ async def get_user_favourite_plans(
     user_id: str,
     skip: int,
     limit: int,
-):
+    after: dict | None = None,
+    projection: dict | None = None,
+) -> tuple[list[dict], str | None]:
+    """Favourite plans of the user, plus the cursor to the next page.
+
+    The cursor follows the favourites rather than the plans, as a favourite
+    may outlive its plan for a moment: delete_plan removes them one after the
+    other.
+    """
     db = r.app.mongodb
-    return [
-        plan
-        async for plan in db[TRAININGS_COLLECTION_NAME].find(
-            filter={"favourited_by": {"$all": [user_id]}}, skip=skip, limit=limit
+    query = {"user_id": user_id}
+    if after is not None:
+        query["plan_id"] = {"$gt": after["_id"]}
+
+    plan_ids = [
+        favourite["plan_id"]
+        async for favourite in db[FAVOURITES_COLLECTION_NAME].find(
+            filter=query,
+            projection={"_id": 0, "plan_id": 1},
+            skip=skip,
+            limit=limit,
+            sort=[("plan_id", ASCENDING)],
         )
     ]
+    plans = {
+        plan["_id"]: plan
+        async for plan in db[TRAININGS_COLLECTION_NAME].find(
+            {"_id": {"$in": plan_ids}}, projection
+        )
+    }
+    cursor = encode_cursor({"_id": plan_ids[-1]}) if len(plan_ids) == limit else None
+    return [plans[plan_id] for plan_id in plan_ids if plan_id in plans], cursor
 
 
 async def delete_user_favourite_plan(r: Request, user_id: str, plan_id: str) -> bool:
     db = r.app.mongodb
-    result = await db[TRAININGS_COLLECTION_NAME].update_one(
-        {"_id": plan_id}, {"$pull": {"favourited_by": user_id}}
+    result = await db[FAVOURITES_COLLECTION_NAME].delete_one(
+        {"user_id": user_id, "plan_id": plan_id}
     )
+    if result.deleted_count == 0:
+        return False
 
-    if result.modified_count == 1:
-        updated_plan = await db[TRAININGS_COLLECTION_NAME].find_one({"_id": plan_id})
-        if updated_plan is not None:
-            return True
-    return False
+    await db[TRAININGS_COLLECTION_NAME].update_one(
+        {"_id": plan_id},
+        {"$inc": {"favourite_count": -1}, "$currentDate": {"updated_at": True}},
+    )
+    plan_changed(r.app, plan_id)
+    return True
 
 
 async def add_favourite(r: Request, user_id: str, favourite: UpdateFavourite) -> bool:
+    """Adds the favourite, then counts it on the plan.
+
+    The two writes aren't atomic: if the process dies in between, the
+    favourite is kept but not counted. The favourites collection is the source
+    of truth, app.commands.backfill_counters recomputes favourite_count from
+    it.
+    """
     db = r.app.mongodb
-    result = await db[TRAININGS_COLLECTION_NAME].update_one(
-        {"_id": favourite.training_id}, {"$addToSet": {"favourited_by": user_id}}
+    plan_id = favourite.training_id
+    try:
+        await db[FAVOURITES_COLLECTION_NAME].insert_one(new_favourite(user_id, plan_id))
+    except DuplicateKeyError:
+        return False
+
+    updated_plan = await db[TRAININGS_COLLECTION_NAME].find_one_and_update(
+        {"_id": plan_id},
+        {"$inc": {"favourite_count": 1}, "$currentDate": {"updated_at": True}},
+        projection={"_id": 1},
     )
-    if result.modified_count == 1:
-        updated_plan = await db[TRAININGS_COLLECTION_NAME].find_one(
-            {"_id": favourite.training_id}
+    plan_changed(r.app, plan_id)
+    if updated_plan is None:
+        await db[FAVOURITES_COLLECTION_NAME].delete_one(
+            {"user_id": user_id, "plan_id": plan_id}
         )
-        if updated_plan is not None:
-            return True
+        return False
 
-    return False
+    return True
 
 
 async def delete_plan(r: Request, plan_id: str) -> bool:
     db = r.app.mongodb
     delete_result = await db[TRAININGS_COLLECTION_NAME].delete_one({"_id": plan_id})
+    plan_changed(r.app, plan_id)
+    catalog_changed(r.app)
 
     if delete_result.deleted_count != 1:
         return False
 
+    await db[FAVOURITES_COLLECTION_NAME].delete_many({"plan_id": plan_id})
     return True
 
 
@@ -141,25 +367,120 @@ async def get_plans(
     admin: bool,
     difficulty: Difficulty | None,
     types: list[str] | None,
-) -> list[TrainingPlan]:
+    after: dict | None = None,
+    projection: dict | None = None,
+) -> tuple[list[TrainingPlan], bool]:
+    """Returns the page of plans and whether it was served from the cache"""
+    cache = r.app.listing_cache
+    key = plans_key(skip, limit, admin, difficulty, types, after, projection)
+    plans = cache.get(key)
+    if plans is not None:
+        return plans, True
+
+    generation = cache.generation
+
+    async def load():
+        db = r.app.mongodb
+        filters = []
+        if difficulty is not None:
+            filters.append({"difficulty": difficulty})
+
+        if types is not None:
+            filters.append({"training_types": {"$all": types}})
+
+        if not admin:
+            filters.append({"blocked": False})
+
+        if after is not None:
+            filters.append({"_id": {"$gt": after["_id"]}})
+
+        query = None
+        if filters:
+            query = {"$and": filters}
+
+        plans = [
+            plan
+            async for plan in db[TRAININGS_COLLECTION_NAME].find(
+                filter=query,
+                projection=projection,
+                skip=skip,
+                limit=limit,
+                sort=[("_id", ASCENDING)],
+            )
+        ]
+        # A plan was written while reading, the listing may already be stale
+        if cache.generation == generation:
+            cache.set(key, plans)
+        return plans
+
+    # Listings of an older generation must not be shared with callers that
+    # arrived after a write
+    plans = await r.app.singleflight.do(("plans", generation, key), load)
+    return plans, False
+
+
+def search_boost() -> dict:
+    """Multiplier of the text score, grows with the rating and the favourites"""
+    mean_score = {
+        "$cond": [
+            {"$gt": [{"$ifNull": ["$review_count", 0]}, 0]},
+            {"$divide": ["$review_score_sum", "$review_count"]},
+            0,
+        ]
+    }
+    favourites = {
+        "$ln": {"$add": [1, {"$max": [{"$ifNull": ["$favourite_count", 0]}, 0]}]}
+    }
+    return {
+        "$add": [
+            1,
+            {"$multiply": [SEARCH_RATING_BOOST, {"$divide": [mean_score, MAX_SCORE]}]},
+            {"$multiply": [SEARCH_FAVOURITES_BOOST, favourites]},
+        ]
+    }
+
+
+async def search_plans(
+    r: Request,
+    text: str,
+    limit: int,
+    admin: bool,
+    difficulty: Difficulty | None,
+    types: list[str] | None,
+    boost: bool,
+    after: dict | None = None,
+    projection: dict | None = None,
+) -> list[dict]:
+    """Plans matching the text, best first, each with its relevance in `score`"""
     db = r.app.mongodb
-    filters = []
+    query = {"$text": {"$search": text}}
     if difficulty is not None:
-        filters.append({"difficulty": difficulty})
+        query["difficulty"] = difficulty
 
     if types is not None:
-        filters.append({"training_types": {"$all": types}})
+        query["training_types"] = {"$all": types}
 
     if not admin:
-        filters.append({"blocked": False})
-
-    query = None
-    if filters:
-        query = {"$and": filters}
-
-    return [
-        plan
-        async for plan in db[TRAININGS_COLLECTION_NAME].find(
-            filter=query, skip=skip, limit=limit
+        query["blocked"] = False
+
+    score = {"$meta": "textScore"}
+    if boost:
+        score = {"$multiply": [score, search_boost()]}
+
+    pipeline = [{"$match": query}, {"$addFields": {"score": score}}]
+    if after is not None:
+        pipeline.append(
+            {
+                "$match": {
+                    "$or": [
+                        {"score": {"$lt": after["score"]}},
+                        {"score": after["score"], "_id": {"$gt": after["_id"]}},
+                    ]
+                }
+            }
         )
-    ]
+    pipeline += [{"$sort": {"score": -1, "_id": 1}}, {"$limit": limit}]
+    if projection is not None:
+        pipeline.append({"$project": {**projection, "score": 1}})
+
+    return [plan async for plan in db[TRAININGS_COLLECTION_NAME].aggregate(pipeline)]
@@ -1,6 +1,7 @@
 from enum import Enum
 from pydantic import BaseModel, Field
 from uuid import uuid4
+from app.config.config import MAX_PAGE_SIZE
 
 MAX_TITLE_LENGTH = 200
 MIN_TITLE_LENGTH = 3
@@ -23,7 +24,6 @@ class TrainingPlan(BaseModel):
     goals: list = Field(...)
     duration: int = Field(...)
     blocked: bool = Field(default=False)
-    favourited_by: list[str] = Field(default=[])
 
     class Config:
         allow_population_by_field_name = True
@@ -44,16 +44,88 @@ class TrainingPlan(BaseModel):
                 ],
                 "duration": 90,
                 "blocked": False,
-                "favourited_by": ["7ca0fa95-af47-40b4-8e39-2fae5ee2667a" ""],
             }
         }
 
 
+class PlanView(str, Enum):
+    full = "full"
+    summary = "summary"
+
+
+class TrainingPlanSummary(BaseModel):
+    id: str = Field(..., alias="_id")
+    trainer: str = Field(...)
+    title: str = Field(...)
+    difficulty: Difficulty
+    training_types: list[str] = Field(...)
+    duration: int = Field(...)
+    blocked: bool = Field(default=False)
+
+    class Config:
+        allow_population_by_field_name = True
+        schema_extra = {
+            "example": {
+                "_id": "0b6a2b1e-58a4-4c1c-9d0f-4c6e8e4f5f6a",
+                "trainer": "c59710ef-f5d0-41ba-a787-ad8eb739ef4c",
+                "title": "Sample training plan",
+                "difficulty": "beginner",
+                "training_types": ["cardio"],
+                "duration": 90,
+                "blocked": False,
+            }
+        }
+
+
+PLAN_FIELDS = {field.alias for field in TrainingPlan.__fields__.values()}
+SUMMARY_FIELDS = {field.alias for field in TrainingPlanSummary.__fields__.values()}
+PLAN_DEFAULTS = {
+    field.alias: field.default for field in TrainingPlan.__fields__.values()
+}
+
+
+def plan_view(plan: dict) -> dict:
+    """The plan as TrainingPlan renders it, without the internal fields"""
+    return {field: plan.get(field, default) for field, default in PLAN_DEFAULTS.items()}
+
+
 class BlockTrainingPlan(BaseModel):
     uid: str = Field(...)
     blocked: bool = Field(...)
 
 
+class BlockStatus(str, Enum):
+    updated = "updated"
+    unchanged = "unchanged"
+    not_found = "not_found"
+    failed = "failed"
+
+
+class BlockTrainingPlanResult(BaseModel):
+    uid: str = Field(...)
+    status: BlockStatus
+
+
+class BlockTrainingPlansResponse(BaseModel):
+    results: list[BlockTrainingPlanResult]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "results": [
+                    {
+                        "uid": "c59710ef-f5d0-41ba-a787-ad8eb739ef4c",
+                        "status": "updated",
+                    },
+                    {
+                        "uid": "7ca0fa95-af47-40b4-8e39-2fae5ee2667a",
+                        "status": "not_found",
+                    },
+                ]
+            }
+        }
+
+
 class UpdateTrainingPlan(BaseModel):
     title: str | None = Field(
         default=None, min_length=MIN_TITLE_LENGTH, max_length=MAX_TITLE_LENGTH
@@ -96,3 +168,23 @@ class UpdateFavourite(BaseModel):
                 "training_id": "7ca0fa95-af47-40b4-8e39-2fae5ee2667a",
             }
         }
+
+
+class BatchGetPlans(BaseModel):
+    ids: list[str] = Field(..., max_items=MAX_PAGE_SIZE)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "ids": [
+                    "c59710ef-f5d0-41ba-a787-ad8eb739ef4c",
+                    "7ca0fa95-af47-40b4-8e39-2fae5ee2667a",
+                ]
+            }
+        }
+
+
+class BatchGetPlansResponse(BaseModel):
+    plans: list[TrainingPlan]
+    # Requested ids that don't belong to any plan
+    missing: list[str]
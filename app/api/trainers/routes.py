@@ -1,61 +1,219 @@
-from fastapi import APIRouter, HTTPException, Request, status, Query
+from fastapi import APIRouter, Header, HTTPException, Request, Response, status, Query
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from starlette.status import HTTP_404_NOT_FOUND
 from app.api.trainers import crud
 from app.api.trainers.models import (
+    PLAN_FIELDS,
+    SUMMARY_FIELDS,
+    BatchGetPlans,
+    BatchGetPlansResponse,
+    BlockStatus,
     BlockTrainingPlan,
+    BlockTrainingPlansResponse,
     Difficulty,
+    PlanView,
     TrainingPlan,
+    TrainingPlanSummary,
     UpdateFavourite,
     UpdateTrainingPlan,
+    plan_view,
 )
+from app.api.responses import TrustedJSONResponse
+from app.api.etag import (
+    ETAG_HEADER,
+    etag_matches,
+    not_modified,
+    plan_etag,
+    plans_etag,
+)
+from app.api.pagination import decode_cursor, next_cursor, page_size, set_next_cursor
 from app.config import config
-from app.api.metrics.service import MetricsService, get_metrics
+from app.config.config import MAX_PAGE_SIZE
 from app.config.config import logger
 
 
 router = APIRouter(tags=["plans"])
 
+CACHE_HEADER = "X-Cache"
+
+
+def plan_projection(view: PlanView, fields: str | None) -> dict | None:
+    if fields is not None:
+        selected = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = selected - PLAN_FIELDS
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields {sorted(unknown)}",
+            )
+        return {field: 1 for field in selected | {"_id"}}
+
+    if view == PlanView.summary:
+        return {field: 1 for field in SUMMARY_FIELDS}
+
+    return None
+
+
+def plans_response(
+    response: Response,
+    plans: list[dict],
+    cursor: str | None,
+    projection: dict | None,
+):
+    set_next_cursor(response, cursor)
+    # Projected plans only hold the fields that were asked for
+    if projection is None:
+        plans = [plan_view(plan) for plan in plans]
+    return TrustedJSONResponse(content=plans, headers=dict(response.headers))
+
+
+def plan_modified(plan_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail=f"Training plan {plan_id} was modified",
+    )
+
 
 @router.post("/plans", response_model=TrainingPlan)
 async def create_plan(plan: TrainingPlan, request: Request):
     created_plan = await crud.create_plan(request, plan)
     logger.info("creating training plan", id=plan.id, trainer=plan.trainer)
-    return JSONResponse(status_code=status.HTTP_201_CREATED, content=created_plan)
+    return JSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content=plan_view(created_plan),
+        headers={ETAG_HEADER: plan_etag(plan.id, created_plan["version"])},
+    )
 
 
 @router.put("/plans/{plan_id}", response_model=TrainingPlan)
-async def update_plan(plan_id: str, plan: UpdateTrainingPlan, request: Request):
+async def update_plan(
+    plan_id: str,
+    plan: UpdateTrainingPlan,
+    request: Request,
+    response: Response,
+    if_match: str | None = Header(default=None),
+):
     logger.info("updating training plan", id=plan_id)
-    updated_plan = await crud.update_plan(request, plan, plan_id)
+    version = None
+    if if_match is not None:
+        version = await crud.get_plan_version(request, plan_id)
+        if version is None:
+            logger.info("failed to update plan", id=plan_id, error="not found")
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail=f"Training plan {plan_id} not found",
+            )
+        if not etag_matches(if_match, plan_etag(plan_id, version), weak=False):
+            logger.info("failed to update plan", id=plan_id, error="stale version")
+            raise plan_modified(plan_id)
+
+    updated_plan = await crud.update_plan(request, plan, plan_id, version)
     if updated_plan is not None:
         logger.info("updated training plan", id=plan_id)
+        response.headers[ETAG_HEADER] = plan_etag(
+            plan_id, updated_plan.get("version", 0)
+        )
         return updated_plan
 
+    # The plan matched If-Match but was written again before the update
+    if version is not None:
+        logger.info("failed to update plan", id=plan_id, error="stale version")
+        raise plan_modified(plan_id)
+
     logger.info("failed to update plan", id=plan_id, error="not found")
     raise HTTPException(
         status_code=HTTP_404_NOT_FOUND, detail=f"Training plan {plan_id} not found"
     )
 
 
-@router.patch("/plans")
+@router.patch("/plans", response_model=BlockTrainingPlansResponse)
 async def block_plan(plans: list[BlockTrainingPlan], request: Request):
-    plan_id, ok = await crud.block_plan(request, plans)
-    # If it errs some user may be blocked
-    if not ok:
-        logger.info("failed to block plan", plan=plan_id)
-        raise HTTPException(
-            status_code=HTTP_404_NOT_FOUND,
-            detail=f"Training plan {plan_id} couldn't be found",
+    results = await crud.block_plan(request, plans)
+    content = jsonable_encoder(BlockTrainingPlansResponse(results=results))
+
+    not_found = [r.uid for r in results if r.status == BlockStatus.not_found]
+    failed = [r.uid for r in results if r.status == BlockStatus.failed]
+    if failed:
+        logger.info("failed to block plans", plans=failed)
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=content
         )
+    # The rest of the batch is still applied, the body tells which plans failed
+    if not_found:
+        logger.info("failed to block plans", plans=not_found, error="not found")
+        return JSONResponse(status_code=HTTP_404_NOT_FOUND, content=content)
+
+    return content
+
+
+@router.post("/plans:batchGet", response_model=BatchGetPlansResponse)
+async def batch_get_plans(batch: BatchGetPlans, request: Request):
+    plans, missing = await crud.get_plans_by_id(request, batch.ids)
+    if missing:
+        logger.info("couldn't get plans", plans=missing, error="not found")
+    return TrustedJSONResponse(
+        content={"plans": [plan_view(plan) for plan in plans], "missing": missing}
+    )
+
+
+SEARCH_CURSOR_KEYS = ("score", "_id")
+
+
+# Declared before /plans/{plan_id}, which would match it otherwise
+@router.get(
+    "/plans/search", response_model=list[TrainingPlan] | list[TrainingPlanSummary]
+)
+async def search_plans(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1),
+    limit: int = 25,
+    cursor: str | None = None,
+    admin: bool = False,
+    difficulty: Difficulty | None = Query(default=None),
+    types: list[str] | None = Query(default=None),
+    boost: bool = True,
+    view: PlanView = PlanView.full,
+    fields: str | None = None,
+):
+    limit = page_size(limit)
+    after = decode_cursor(cursor, SEARCH_CURSOR_KEYS)
+    projection = plan_projection(view, fields)
+    plans = await crud.search_plans(
+        request, q, limit, admin, difficulty, types, boost, after, projection
+    )
+    set_next_cursor(response, next_cursor(plans, limit, SEARCH_CURSOR_KEYS))
+
+    if projection is None:
+        plans = [plan_view(plan) for plan in plans]
+    else:
+        for plan in plans:
+            del plan["score"]
+    return TrustedJSONResponse(content=plans, headers=dict(response.headers))
 
 
 @router.get("/plans/{plan_id}", response_model=TrainingPlan)
-async def get_plan(plan_id: str, request: Request):
+async def get_plan(
+    plan_id: str,
+    request: Request,
+    if_none_match: str | None = Header(default=None),
+):
+    # Only the version is read to answer a conditional request
+    if if_none_match is not None:
+        version = await crud.get_plan_version(request, plan_id, cached=True)
+        if version is not None:
+            etag = plan_etag(plan_id, version)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+
     plan = await crud.get_plan(request, plan_id)
 
     if plan is not None:
-        return plan
+        return TrustedJSONResponse(
+            content=plan_view(plan),
+            headers={ETAG_HEADER: plan_etag(plan_id, plan.get("version", 0))},
+        )
 
     logger.info("couldn't get plan", plan=plan_id, error="not found")
     raise HTTPException(
@@ -63,11 +221,47 @@ async def get_plan(plan_id: str, request: Request):
     )
 
 
-@router.get("/trainers/{trainer_id}/plans", response_model=list[TrainingPlan])
+@router.get(
+    "/trainers/{trainer_id}/plans",
+    response_model=list[TrainingPlan] | list[TrainingPlanSummary],
+)
 async def get_trainer_training_plans(
-    trainer_id: str, request: Request, admin: bool = False
+    trainer_id: str,
+    request: Request,
+    response: Response,
+    admin: bool = False,
+    limit: int = MAX_PAGE_SIZE,
+    cursor: str | None = None,
+    view: PlanView = PlanView.full,
+    fields: str | None = None,
+    if_none_match: str | None = Header(default=None),
 ):
-    return await crud.get_trainer_plans(request, trainer_id, admin)
+    """Plans of the trainer, sorted by id. Returns at most limit plans, capped
+    at MAX_PAGE_SIZE (100 by default): follow the X-Next-Cursor header to get
+    the rest"""
+    limit = page_size(limit)
+    after = decode_cursor(cursor)
+    projection = plan_projection(view, fields)
+    returned = sorted(projection) if projection is not None else None
+    if if_none_match is not None:
+        versions = await crud.get_trainer_plan_versions(
+            request, trainer_id, admin, limit, after
+        )
+        etag = plans_etag(versions, returned)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    plans = await crud.get_trainer_plans(
+        request, trainer_id, admin, limit, after, projection
+    )
+    response.headers[ETAG_HEADER] = plans_etag(
+        [(plan["_id"], plan.get("version", 0)) for plan in plans], returned
+    )
+    # The version is only kept to build the ETag
+    if projection is not None:
+        for plan in plans:
+            plan.pop("version", None)
+    return plans_response(response, plans, next_cursor(plans, limit), projection)
 
 
 @router.delete("/plans/{trainer_id}/{plan_id}")
@@ -83,16 +277,31 @@ async def delete_plan(plan_id: str, request: Request):
     return JSONResponse(status_code=status.HTTP_204_NO_CONTENT, content=None)
 
 
-@router.get("/plans", response_model=list[TrainingPlan])
+@router.get("/plans", response_model=list[TrainingPlan] | list[TrainingPlanSummary])
 async def get_plans(
     request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 25,
+    cursor: str | None = None,
     admin: bool = False,
     difficulty: Difficulty | None = Query(default=None),
     types: list[str] | None = Query(default=None),
+    view: PlanView = PlanView.full,
+    fields: str | None = None,
 ):
-    return await crud.get_plans(request, skip, limit, admin, difficulty, types)
+    limit = page_size(limit)
+    after = decode_cursor(cursor)
+    # The cursor already points past the skipped plans
+    if after is not None:
+        skip = 0
+
+    projection = plan_projection(view, fields)
+    plans, cached = await crud.get_plans(
+        request, skip, limit, admin, difficulty, types, after, projection
+    )
+    response.headers[CACHE_HEADER] = "HIT" if cached else "MISS"
+    return plans_response(response, plans, next_cursor(plans, limit), projection)
 
 
 @router.post("/users/{user_id}/trainings/favourites")
@@ -111,19 +320,33 @@ async def add_favourite(user_id: str, favourite: UpdateFavourite, request: Reque
         )
     logger.info("added favourite", user=user_id, plan=favourite.training_id)
     if config.METRICS_URL is not None:
-        metrics = await get_metrics(request, favourite.training_id)
-        if metrics is not None:
-            await MetricsService(metrics).send()
+        request.app.metrics_dispatcher.submit(favourite.training_id)
 
 
-@router.get("/users/{user_id}/trainings/favourites", response_model=list[TrainingPlan])
+@router.get(
+    "/users/{user_id}/trainings/favourites",
+    response_model=list[TrainingPlan] | list[TrainingPlanSummary],
+)
 async def get_user_favourite_plans(
     user_id: str,
     request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 25,
+    cursor: str | None = None,
+    view: PlanView = PlanView.full,
+    fields: str | None = None,
 ):
-    return await crud.get_user_favourite_plans(request, user_id, skip, limit)
+    limit = page_size(limit)
+    after = decode_cursor(cursor)
+    if after is not None:
+        skip = 0
+
+    projection = plan_projection(view, fields)
+    plans, cursor = await crud.get_user_favourite_plans(
+        request, user_id, skip, limit, after, projection
+    )
+    return plans_response(response, plans, cursor, projection)
 
 
 @router.delete(
@@ -140,6 +363,4 @@ async def delete_user_favourite_plan(user_id: str, plan_id: str, request: Reques
         )
     logger.info("removed favourite", user=user_id, plan=plan_id)
     if config.METRICS_URL is not None:
-        metrics = await get_metrics(request, plan_id)
-        if metrics is not None:
-            await MetricsService(metrics).send()
+        request.app.metrics_dispatcher.submit(plan_id)
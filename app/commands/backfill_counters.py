@@ -0,0 +1,73 @@
+"""Recomputes the review and favourite counters kept on every training plan.
+
+Meant to be run once, while writes are paused, over data created before the
+counters existed, after app.commands.migrate_favourites. It also repairs
+counters left behind by a write that failed halfway:
+
+    python -m app.commands.backfill_counters
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from app.config.config import logger
+from app.config.database import (
+    DB_NAME,
+    FAVOURITES_COLLECTION_NAME,
+    MONGO_URL,
+    REVIEWS_COLLECTION_NAME,
+    TRAININGS_COLLECTION_NAME,
+)
+
+BATCH_SIZE = 1000
+
+
+async def backfill_counters(db: AsyncIOMotorDatabase):
+    result = await db[TRAININGS_COLLECTION_NAME].update_many(
+        {}, {"$set": {"favourite_count": 0, "review_count": 0, "review_score_sum": 0}}
+    )
+    logger.info("reset plan counters", plans=result.modified_count)
+
+    reviews_pipeline = [
+        {
+            "$group": {
+                "_id": "$plan_id",
+                "review_count": {"$sum": 1},
+                "review_score_sum": {"$sum": "$score"},
+            }
+        }
+    ]
+    await set_counters(db, db[REVIEWS_COLLECTION_NAME].aggregate(reviews_pipeline))
+    logger.info("backfilled review counters")
+
+    favourites_pipeline = [
+        {"$group": {"_id": "$plan_id", "favourite_count": {"$sum": 1}}}
+    ]
+    await set_counters(
+        db, db[FAVOURITES_COLLECTION_NAME].aggregate(favourites_pipeline)
+    )
+    logger.info("backfilled favourite counters")
+
+
+async def set_counters(db: AsyncIOMotorDatabase, counters):
+    updates = []
+    async for plan_counters in counters:
+        plan_id = plan_counters.pop("_id")
+        updates.append(UpdateOne({"_id": plan_id}, {"$set": plan_counters}))
+        if len(updates) == BATCH_SIZE:
+            await db[TRAININGS_COLLECTION_NAME].bulk_write(updates, ordered=False)
+            updates = []
+
+    if updates:
+        await db[TRAININGS_COLLECTION_NAME].bulk_write(updates, ordered=False)
+
+
+async def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    try:
+        await backfill_counters(client[DB_NAME])
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,29 @@
+"""Creates the declared indexes without tying the build to a deploy.
+
+Useful for large collections, together with CREATE_INDEXES_ON_STARTUP=false:
+
+    python -m app.commands.ensure_indexes
+
+--rebuild drops and recreates the indexes whose keys or options drifted from
+their declaration.
+"""
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.config.database import DB_NAME, MONGO_URL
+from app.config.indexes import ensure_indexes
+
+
+async def main(rebuild: bool):
+    client = AsyncIOMotorClient(MONGO_URL)
+    try:
+        await ensure_indexes(client[DB_NAME], rebuild=rebuild)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.rebuild))
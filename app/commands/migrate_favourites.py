@@ -0,0 +1,95 @@
+"""Moves the favourited_by arrays embedded in training plans to the favourites
+collection, one batch of plans at a time:
+
+    python -m app.commands.migrate_favourites
+
+It can be re-run safely, favourites that were already moved are skipped and
+the favourite counter of every migrated plan is recomputed from the
+collection.
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.api.trainers.crud import new_favourite
+from app.config.config import logger
+from app.config.database import (
+    DB_NAME,
+    FAVOURITES_COLLECTION_NAME,
+    MONGO_URL,
+    TRAININGS_COLLECTION_NAME,
+)
+from app.config.indexes import ensure_indexes
+
+BATCH_SIZE = 500
+DUPLICATE_KEY_ERROR = 11000
+
+
+async def migrate_batch(db: AsyncIOMotorDatabase, plans: list[dict]):
+    favourites = [
+        new_favourite(user_id, plan["_id"])
+        for plan in plans
+        for user_id in plan.get("favourited_by") or []
+    ]
+    if favourites:
+        try:
+            await db[FAVOURITES_COLLECTION_NAME].insert_many(favourites, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+
+    plan_ids = [plan["_id"] for plan in plans]
+    counts = {plan_id: 0 for plan_id in plan_ids}
+    pipeline = [
+        {"$match": {"plan_id": {"$in": plan_ids}}},
+        {"$group": {"_id": "$plan_id", "count": {"$sum": 1}}},
+    ]
+    async for count in db[FAVOURITES_COLLECTION_NAME].aggregate(pipeline):
+        counts[count["_id"]] = count["count"]
+
+    await db[TRAININGS_COLLECTION_NAME].bulk_write(
+        [
+            UpdateOne(
+                {"_id": plan_id},
+                {"$set": {"favourite_count": count}, "$unset": {"favourited_by": ""}},
+            )
+            for plan_id, count in counts.items()
+        ],
+        ordered=False,
+    )
+
+
+async def migrate_favourites(db: AsyncIOMotorDatabase):
+    # Re-runs rely on the unique index to skip the favourites already moved
+    await ensure_indexes(db)
+    cursor = db[TRAININGS_COLLECTION_NAME].find(
+        {"favourited_by": {"$exists": True}}, {"favourited_by": 1}
+    )
+
+    migrated = 0
+    plans = []
+    async for plan in cursor:
+        plans.append(plan)
+        if len(plans) == BATCH_SIZE:
+            await migrate_batch(db, plans)
+            migrated += len(plans)
+            logger.info("migrating favourites", plans=migrated)
+            plans = []
+
+    if plans:
+        await migrate_batch(db, plans)
+        migrated += len(plans)
+    logger.info("migrated favourites", plans=migrated)
+
+
+async def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    try:
+        await migrate_favourites(client[DB_NAME])
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,17 @@
 from collections.abc import Iterable
 import os
+import sys
+import orjson
 import structlog
 import logging
 
 from structlog.types import Processor
+from app.config.logs import (
+    EventSampler,
+    QueueLoggerFactory,
+    QueueWriter,
+    parse_sample_rates,
+)
 
 DEFAULT_LEVEL = "INFO"
 LOGGER_NAME = "Trainings"
@@ -14,43 +22,120 @@ def get_log_level() -> int:
     return logging.getLevelName(level)
 
 
-structlog_processors = [
-    structlog.processors.dict_tracebacks,
-    structlog.processors.JSONRenderer(),
-]
+# console for development, json in production
+LOG_FORMAT = os.getenv("LOG_FORMAT", "console").lower()
+# Lines waiting for the writer thread, 0 writes them from the caller
+LOG_QUEUE_SIZE = int(
+    os.getenv("LOG_QUEUE_SIZE", "10000" if LOG_FORMAT == "json" else "0")
+)
+LOG_SAMPLE_RATES = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
 
 DEV_ENV = os.getenv("DEV", "false").lower()
 METRICS_URL = os.getenv("METRICS_SERVICE_URL", None)
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30.0"))
+LISTING_CACHE_MAX_ENTRIES = int(os.getenv("LISTING_CACHE_MAX_ENTRIES", "1000"))
+LISTING_CACHE_MAX_BYTES = int(
+    os.getenv("LISTING_CACHE_MAX_BYTES", str(32 * 1024 * 1024))
+)
+LISTING_CACHE_TTL = float(os.getenv("LISTING_CACHE_TTL", "10.0"))
+SEARCH_RATING_BOOST = float(os.getenv("SEARCH_RATING_BOOST", "0.5"))
+SEARCH_FAVOURITES_BOOST = float(os.getenv("SEARCH_FAVOURITES_BOOST", "0.1"))
+LEADERBOARD_PRIOR_WEIGHT = float(os.getenv("LEADERBOARD_PRIOR_WEIGHT", "10"))
+LEADERBOARD_TREND_DAYS = float(os.getenv("LEADERBOARD_TREND_DAYS", "7"))
+LEADERBOARD_REFRESH_INTERVAL = float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "5.0"))
+LEADERBOARD_REBUILD_INTERVAL = float(
+    os.getenv("LEADERBOARD_REBUILD_INTERVAL", "3600.0")
+)
+RECOMMENDATIONS_DURATION_WEIGHT = float(
+    os.getenv("RECOMMENDATIONS_DURATION_WEIGHT", "0.5")
+)
+RECOMMENDATIONS_POPULARITY_WEIGHT = float(
+    os.getenv("RECOMMENDATIONS_POPULARITY_WEIGHT", "0.25")
+)
+RECOMMENDATIONS_REFRESH_INTERVAL = float(
+    os.getenv("RECOMMENDATIONS_REFRESH_INTERVAL", "5.0")
+)
+RECOMMENDATIONS_REBUILD_INTERVAL = float(
+    os.getenv("RECOMMENDATIONS_REBUILD_INTERVAL", "3600.0")
+)
+RECOMMENDATIONS_OVERFETCH = int(os.getenv("RECOMMENDATIONS_OVERFETCH", "2"))
+RECOMMENDATIONS_REFRESH_OVERLAP = float(
+    os.getenv("RECOMMENDATIONS_REFRESH_OVERLAP", "30.0")
+)
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_WINDOW = float(os.getenv("SLOW_QUERY_WINDOW", "900.0"))
+SLOW_QUERY_MAX_ENTRIES = int(os.getenv("SLOW_QUERY_MAX_ENTRIES", "10000"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+METRICS_QUEUE_SIZE = int(os.getenv("METRICS_QUEUE_SIZE", "1000"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))
+METRICS_MAX_CONNECTIONS = int(os.getenv("METRICS_MAX_CONNECTIONS", "100"))
+METRICS_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("METRICS_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+METRICS_KEEPALIVE_EXPIRY = float(os.getenv("METRICS_KEEPALIVE_EXPIRY", "30.0"))
+METRICS_CONNECT_TIMEOUT = float(os.getenv("METRICS_CONNECT_TIMEOUT", "2.0"))
+METRICS_READ_TIMEOUT = float(os.getenv("METRICS_READ_TIMEOUT", "5.0"))
+METRICS_HTTP2 = os.getenv("METRICS_HTTP2", "false").lower() == "true"
 
 
-def get_processors() -> Iterable[Processor]:
+def get_processors(
+    log_format: str, sample_rates: dict[str, float]
+) -> Iterable[Processor]:
     timestamper = structlog.processors.TimeStamper(fmt="iso", utc=True)
     processors = [
+        EventSampler(sample_rates),
         structlog.processors.add_log_level,
         structlog.contextvars.merge_contextvars,
         structlog.processors.StackInfoRenderer(),
-        structlog.dev.set_exc_info,
-        timestamper,
     ]
 
-    # json_processors = [
-    #     structlog.processors.dict_tracebacks,
-    #     structlog.processors.JSONRenderer(),
-    # ]
-    # if DEV_ENV == "false":
-    #     processors += json_processors
-    # else:
-    processors += [structlog.dev.ConsoleRenderer()]
+    if log_format == "json":
+        processors += [
+            timestamper,
+            structlog.processors.dict_tracebacks,
+            # Unlike json.dumps, orjson refuses keys that aren't strings
+            # unless told otherwise
+            structlog.processors.JSONRenderer(
+                serializer=orjson.dumps, option=orjson.OPT_NON_STR_KEYS
+            ),
+        ]
+    else:
+        processors += [
+            structlog.dev.set_exc_info,
+            timestamper,
+            structlog.dev.ConsoleRenderer(),
+        ]
 
     return processors
 
 
-structlog.configure(
-    processors=get_processors(),
-    wrapper_class=structlog.make_filtering_bound_logger(get_log_level()),
-    logger_factory=structlog.WriteLoggerFactory(),
-    cache_logger_on_first_use=False,
-)
+def get_logger_factory(log_format: str, queue_size: int, file=None):
+    if queue_size > 0:
+        return QueueLoggerFactory(QueueWriter(file or sys.stdout.buffer, queue_size))
+    if log_format == "json":
+        # The JSON renderer outputs bytes
+        return structlog.BytesLoggerFactory(file or sys.stdout.buffer)
+    return structlog.WriteLoggerFactory(file)
+
+
+def configure_logging(
+    log_format: str, queue_size: int, sample_rates: dict[str, float], file=None
+):
+    structlog.configure(
+        processors=get_processors(log_format, sample_rates),
+        wrapper_class=structlog.make_filtering_bound_logger(get_log_level()),
+        logger_factory=get_logger_factory(log_format, queue_size, file),
+        cache_logger_on_first_use=True,
+    )
+
+
+configure_logging(LOG_FORMAT, LOG_QUEUE_SIZE, LOG_SAMPLE_RATES)
 
 logger = structlog.getLogger(name=LOGGER_NAME)
 logger.info(f"METRICS_URL={METRICS_URL}")
@@ -5,7 +5,12 @@ import os
 MONGO_URL = os.getenv("MONGO_URL", "")
 TRAININGS_COLLECTION_NAME = "trainings"
 REVIEWS_COLLECTION_NAME = "reviews"
+FAVOURITES_COLLECTION_NAME = "favourites"
+RANKINGS_COLLECTION_NAME = "plan_rankings"
 DB_NAME = "trainers_test"
+CREATE_INDEXES_ON_STARTUP = (
+    os.getenv("CREATE_INDEXES_ON_STARTUP", "true").lower() == "true"
+)
 
 
 # client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
@@ -0,0 +1,182 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from app.config.config import logger
+from app.config.database import (
+    FAVOURITES_COLLECTION_NAME,
+    RANKINGS_COLLECTION_NAME,
+    REVIEWS_COLLECTION_NAME,
+    TRAININGS_COLLECTION_NAME,
+)
+
+# Every query shape issued by the crud modules must be served by one of these
+INDEXES: dict[str, list[IndexModel]] = {
+    TRAININGS_COLLECTION_NAME: [
+        # get_trainer_plans, for users and for admins, who also see the
+        # blocked ones. Every listing index ends in _id so pages come sorted
+        # from the index
+        IndexModel(
+            [("trainer", ASCENDING), ("blocked", ASCENDING), ("_id", ASCENDING)]
+        ),
+        IndexModel([("trainer", ASCENDING), ("_id", ASCENDING)]),
+        # get_plans, for users
+        IndexModel(
+            [
+                ("difficulty", ASCENDING),
+                ("training_types", ASCENDING),
+                ("blocked", ASCENDING),
+                ("_id", ASCENDING),
+            ]
+        ),
+        IndexModel(
+            [("training_types", ASCENDING), ("blocked", ASCENDING), ("_id", ASCENDING)]
+        ),
+        IndexModel(
+            [("difficulty", ASCENDING), ("blocked", ASCENDING), ("_id", ASCENDING)]
+        ),
+        IndexModel([("blocked", ASCENDING), ("_id", ASCENDING)]),
+        # get_plans, for admins
+        IndexModel(
+            [
+                ("difficulty", ASCENDING),
+                ("training_types", ASCENDING),
+                ("_id", ASCENDING),
+            ]
+        ),
+        IndexModel([("training_types", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("difficulty", ASCENDING), ("_id", ASCENDING)]),
+        # Incremental exports
+        IndexModel([("updated_at", ASCENDING)]),
+        # search_plans, matches in titles count more than in descriptions
+        IndexModel(
+            [("title", TEXT), ("description", TEXT)],
+            weights={"title": 3, "description": 1},
+            name="plan_text",
+        ),
+    ],
+    REVIEWS_COLLECTION_NAME: [
+        # One review per user and plan, also serves get_average_score
+        IndexModel([("plan_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        # Keyset pagination of get_reviews
+        IndexModel([("plan_id", ASCENDING), ("_id", ASCENDING)]),
+        # Incremental exports
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    FAVOURITES_COLLECTION_NAME: [
+        # One favourite per user and plan, also serves get_user_favourite_plans
+        IndexModel([("user_id", ASCENDING), ("plan_id", ASCENDING)], unique=True),
+        # delete_plan, the counters backfill and the trend of a plan
+        IndexModel([("plan_id", ASCENDING), ("created_at", ASCENDING)]),
+        # Trends of every plan, on a leaderboards rebuild
+        IndexModel([("created_at", ASCENDING)]),
+    ],
+    RANKINGS_COLLECTION_NAME: [
+        # Leaderboards, overall and by difficulty or type
+        IndexModel([("score", DESCENDING), ("_id", ASCENDING)]),
+        IndexModel(
+            [("difficulty", ASCENDING), ("score", DESCENDING), ("_id", ASCENDING)]
+        ),
+        IndexModel(
+            [("training_types", ASCENDING), ("score", DESCENDING), ("_id", ASCENDING)]
+        ),
+        IndexModel([("trend", DESCENDING), ("_id", ASCENDING)]),
+        IndexModel(
+            [("difficulty", ASCENDING), ("trend", DESCENDING), ("_id", ASCENDING)]
+        ),
+        IndexModel(
+            [("training_types", ASCENDING), ("trend", DESCENDING), ("_id", ASCENDING)]
+        ),
+        # Rankings a rebuild didn't write
+        IndexModel([("rebuild_id", ASCENDING)]),
+    ],
+}
+
+# Options that make two indexes with the same keys different
+DRIFT_OPTIONS = ["unique", "sparse", "weights"]
+
+
+def find_drift(collection: str, declared: list[IndexModel], existing: dict) -> set:
+    drifted = set()
+    declared_by_name = {index.document["name"]: index.document for index in declared}
+
+    for name, info in existing.items():
+        if name == "_id_":
+            continue
+
+        index = declared_by_name.get(name)
+        if index is None:
+            logger.info("undeclared index", collection=collection, index=name)
+            continue
+
+        # Text indexes list their fields in weights, under generic keys
+        if TEXT in index["key"].values():
+            same_keys = set(index["key"]) == set(info.get("weights", {}))
+        else:
+            same_keys = list(index["key"].items()) == [tuple(k) for k in info["key"]]
+        same_options = all(
+            index.get(option) == info.get(option) for option in DRIFT_OPTIONS
+        )
+        if not same_keys or not same_options:
+            logger.info("index drift", collection=collection, index=name)
+            drifted.add(name)
+
+    return drifted
+
+
+async def ensure_indexes(
+    db: AsyncIOMotorDatabase, background: bool = True, rebuild: bool = False
+):
+    for collection, declared in INDEXES.items():
+        existing = await db[collection].index_information()
+        drifted = find_drift(collection, declared, existing)
+
+        # Drifted indexes are only replaced on request, dropping them on a
+        # regular startup could leave a big collection without its index
+        if rebuild:
+            for name in drifted:
+                logger.info("dropping drifted index", collection=collection, index=name)
+                await db[collection].drop_index(name)
+                del existing[name]
+
+        for index in declared:
+            name = index.document["name"]
+            if name in existing:
+                continue
+
+            keys = list(index.document["key"].items())
+            options = {k: v for k, v in index.document.items() if k != "key"}
+            logger.info("creating index", collection=collection, index=name)
+            try:
+                await db[collection].create_index(
+                    keys, background=background, **options
+                )
+            except OperationFailure as e:
+                logger.info(
+                    "failed to create index",
+                    collection=collection,
+                    index=name,
+                    error=str(e),
+                )
+
+
+async def check_unique_indexes(db: AsyncIOMotorDatabase):
+    """Fails unless every declared unique index exists and is unique.
+
+    Writes such as create_review rely on them to reject duplicates, so
+    serving without one would silently accept them. It happens when the
+    build fails on existing duplicates, or when indexes aren't created on
+    startup and nobody ran the maintenance command.
+    """
+    missing = []
+    for collection, declared in INDEXES.items():
+        existing = await db[collection].index_information()
+        for index in declared:
+            name = index.document["name"]
+            if index.document.get("unique") and not existing.get(name, {}).get(
+                "unique"
+            ):
+                missing.append(f"{collection}.{name}")
+
+    if missing:
+        logger.info("missing unique indexes", indexes=missing)
+        raise RuntimeError(f"Missing unique indexes: {', '.join(missing)}")
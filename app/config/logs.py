@@ -0,0 +1,127 @@
+import atexit
+import queue
+import random
+import threading
+from typing import BinaryIO
+import structlog
+from structlog.types import EventDict, WrappedLogger
+
+# Levels that sampling applies to, warnings and errors are always logged
+SAMPLED_LEVELS = {"debug", "info"}
+
+
+def parse_sample_rates(rates: str) -> dict[str, float]:
+    """Rates by event, from "retrieved plan=0.1,added favourite=0.5" """
+    sample_rates = {}
+    for rate in rates.split(","):
+        if not rate.strip():
+            continue
+        event, _, value = rate.rpartition("=")
+        sample_rates[event.strip()] = float(value)
+    return sample_rates
+
+
+class EventSampler:
+    """Keeps only a fraction of the debug and info lines of the given events.
+
+    Kept lines carry their sample_rate, so counts taken from the logs can be
+    scaled back. It goes first in the chain, so the dropped lines aren't
+    rendered at all.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        self.rates = rates
+
+    def __call__(
+        self, logger: WrappedLogger, method_name: str, event_dict: EventDict
+    ) -> EventDict:
+        rate = self.rates.get(event_dict.get("event"))
+        if rate is None or method_name not in SAMPLED_LEVELS:
+            return event_dict
+
+        if random.random() >= rate:
+            raise structlog.DropEvent
+        event_dict["sample_rate"] = rate
+        return event_dict
+
+
+class QueueWriter:
+    """Writes log lines to a file from a thread of its own.
+
+    Callers only enqueue the rendered line, so the event loop never waits on
+    the file. The thread writes whatever piled up in one go. When the queue is
+    full lines are dropped and counted rather than blocking the caller, and
+    what's queued is written out before the process exits.
+    """
+
+    def __init__(self, file: BinaryIO, max_lines: int):
+        self.file = file
+        self.dropped = 0
+        # Lines are written from any thread
+        self._dropped_lock = threading.Lock()
+        self._queue: queue.Queue[bytes | None] = queue.Queue(maxsize=max_lines)
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, line: bytes):
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            lines = [self._queue.get()]
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.file.write(
+                    b"".join(line + b"\n" for line in lines if line is not None)
+                )
+                self.file.flush()
+            except Exception:
+                # Nowhere left to report it
+                pass
+            if None in lines:
+                return
+
+
+class QueueLogger:
+    """structlog logger that hands its lines to a QueueWriter"""
+
+    def __init__(self, writer: QueueWriter):
+        self._writer = writer
+
+    def msg(self, message: str | bytes):
+        if isinstance(message, str):
+            message = message.encode()
+        self._writer.write(message)
+
+    log = debug = info = warn = warning = msg
+    err = error = critical = exception = fatal = failure = msg
+
+
+class QueueLoggerFactory:
+    def __init__(self, writer: QueueWriter):
+        self.writer = writer
+        self._logger = QueueLogger(writer)
+
+    def __call__(self, *args) -> QueueLogger:
+        return self._logger
@@ -1,11 +1,47 @@
 from fastapi import FastAPI
-from app.config.config import DEV_ENV, logger
+from app.config.config import (
+    CACHE_MAX_BYTES,
+    CACHE_MAX_ENTRIES,
+    CACHE_TTL,
+    DEV_ENV,
+    LISTING_CACHE_MAX_BYTES,
+    LISTING_CACHE_MAX_ENTRIES,
+    LEADERBOARD_REBUILD_INTERVAL,
+    LEADERBOARD_REFRESH_INTERVAL,
+    LISTING_CACHE_TTL,
+    RECOMMENDATIONS_REBUILD_INTERVAL,
+    RECOMMENDATIONS_REFRESH_INTERVAL,
+    RECOMMENDATIONS_REFRESH_OVERLAP,
+    METRICS_FLUSH_INTERVAL,
+    METRICS_QUEUE_SIZE,
+    METRICS_URL,
+    SLOW_QUERY_MAX_ENTRIES,
+    SLOW_QUERY_THRESHOLD_MS,
+    SLOW_QUERY_WINDOW,
+    logger,
+)
+from app.api.cache import EntityCache, ListingCache
+from app.api.singleflight import SingleFlight
+from app.api.leaderboards.refresher import LeaderboardRefresher
+from app.api.recommendations.refresher import PlanIndexRefresher
+from app.api.metrics.dispatcher import MetricsDispatcher
+from app.api.metrics.service import MetricsService, build_client
+from app.api.monitoring.collector import AppCollector
+from app.api.monitoring.listener import MongoCommandMetrics
+from app.api.monitoring.middleware import PrometheusMiddleware
+from app.api.monitoring.profiler import SlowQueryProfiler
 from app.api.trainers import routes as trainers_routes
 from app.api.reviews import routes as reviews_routes
-from app.config.database import DB_NAME, MONGO_URL
+from app.api.bulk import routes as bulk_routes
+from app.api.leaderboards import routes as leaderboards_routes
+from app.api.recommendations import routes as recommendations_routes
+from app.api.monitoring import routes as monitoring_routes
+from app.config.database import CREATE_INDEXES_ON_STARTUP, DB_NAME, MONGO_URL
+from app.config.indexes import check_unique_indexes, ensure_indexes
 from motor.motor_asyncio import AsyncIOMotorClient
 from ddtrace.contrib.asgi import TraceMiddleware
 from ddtrace import config
+from prometheus_client import REGISTRY
 
 import asyncio
 
@@ -16,13 +52,88 @@ app = FastAPI()
 if DEV_ENV == "true":
     app.add_middleware(TraceMiddleware)
 
+app.add_middleware(PrometheusMiddleware)
+REGISTRY.register(AppCollector(app))
+
 
 @app.on_event("startup")
 async def startup_db_client():
     logger.info("Connecting to database")
-    app.mongodb_client = AsyncIOMotorClient(MONGO_URL)
+    app.slow_query_profiler = SlowQueryProfiler(
+        SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_WINDOW, SLOW_QUERY_MAX_ENTRIES
+    )
+    app.mongodb_client = AsyncIOMotorClient(
+        MONGO_URL, event_listeners=[MongoCommandMetrics(), app.slow_query_profiler]
+    )
     app.mongodb_client.get_io_loop = asyncio.get_event_loop
     app.mongodb = app.mongodb_client[DB_NAME]
+    if CREATE_INDEXES_ON_STARTUP:
+        await ensure_indexes(app.mongodb)
+    await check_unique_indexes(app.mongodb)
+
+
+@app.on_event("startup")
+async def startup_caches():
+    app.entity_cache = EntityCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL)
+    app.listing_cache = ListingCache(
+        LISTING_CACHE_MAX_ENTRIES, LISTING_CACHE_MAX_BYTES, LISTING_CACHE_TTL
+    )
+    app.singleflight = SingleFlight()
+
+
+@app.on_event("startup")
+async def startup_metrics_dispatcher():
+    app.metrics_client = build_client()
+    app.metrics_dispatcher = MetricsDispatcher(
+        app.mongodb,
+        MetricsService(app.metrics_client),
+        METRICS_QUEUE_SIZE,
+        METRICS_FLUSH_INTERVAL,
+    )
+    if METRICS_URL is not None:
+        logger.info("Starting metrics dispatcher")
+        app.metrics_dispatcher.start()
+
+
+@app.on_event("startup")
+async def startup_leaderboard_refresher():
+    logger.info("Starting leaderboard refresher")
+    app.leaderboard_refresher = LeaderboardRefresher(
+        app.mongodb, LEADERBOARD_REFRESH_INTERVAL, LEADERBOARD_REBUILD_INTERVAL
+    )
+    app.leaderboard_refresher.start()
+
+
+@app.on_event("startup")
+async def startup_plan_index_refresher():
+    logger.info("Starting plan index refresher")
+    app.plan_index_refresher = PlanIndexRefresher(
+        app.mongodb,
+        app.singleflight,
+        RECOMMENDATIONS_REFRESH_INTERVAL,
+        RECOMMENDATIONS_REBUILD_INTERVAL,
+        RECOMMENDATIONS_REFRESH_OVERLAP,
+    )
+    app.plan_index_refresher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_plan_index_refresher():
+    logger.info("Stopping plan index refresher")
+    await app.plan_index_refresher.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_leaderboard_refresher():
+    logger.info("Stopping leaderboard refresher")
+    await app.leaderboard_refresher.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_metrics_dispatcher():
+    logger.info("Stopping metrics dispatcher")
+    await app.metrics_dispatcher.stop()
+    await app.metrics_client.aclose()
 
 
 @app.on_event("shutdown")
@@ -33,3 +144,7 @@ async def shutdown_db_client():
 
 app.include_router(trainers_routes.router)
 app.include_router(reviews_routes.router)
+app.include_router(bulk_routes.router)
+app.include_router(leaderboards_routes.router)
+app.include_router(recommendations_routes.router)
+app.include_router(monitoring_routes.router)
@@ -0,0 +1,104 @@
+"""Measures the time the event loop spends logging per request, with the
+former development setup and with the production one.
+
+    python -m benchmarks.bench_logging
+
+Lines go to /dev/null, and then to a file that takes WRITE_DELAY for every
+write, as stdout does when whatever reads it falls behind.
+"""
+import os
+import time
+import timeit
+import structlog
+from app.config.config import (
+    LOGGER_NAME,
+    configure_logging,
+    get_log_level,
+    get_processors,
+)
+
+REQUESTS = 1000
+ROUNDS = 5
+PLAN_ID = "c59710ef-f5d0-41ba-a787-ad8eb739ef4c"
+WRITE_DELAY = 0.0001
+
+
+class SlowFile:
+    """File whose writes block for WRITE_DELAY"""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        time.sleep(WRITE_DELAY)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+def handle_request(logger):
+    # What update_plan logs on success, plus the access of a plan
+    logger.info("updating training plan", id=PLAN_ID)
+    logger.info("updated training plan", id=PLAN_ID)
+    logger.info("retrieved plan", id=PLAN_ID, trainer="trainer", version=3)
+
+
+def configure_former(file):
+    structlog.configure(
+        processors=get_processors("console", {}),
+        wrapper_class=structlog.make_filtering_bound_logger(get_log_level()),
+        logger_factory=structlog.WriteLoggerFactory(file),
+        cache_logger_on_first_use=False,
+    )
+
+
+def wait_for_writer():
+    writer = getattr(structlog.get_config()["logger_factory"], "writer", None)
+    while writer is not None and not writer._queue.empty():
+        time.sleep(0.001)
+    return writer
+
+
+def setups(text, binary) -> list:
+    queue_size = REQUESTS * 3
+    return [
+        ("console, sync", lambda: configure_former(text)),
+        ("json, sync", lambda: configure_logging("json", 0, {}, binary)),
+        ("json, queued", lambda: configure_logging("json", queue_size, {}, binary)),
+        (
+            "json, queued, sampled",
+            lambda: configure_logging(
+                "json", queue_size, {"retrieved plan": 0.1}, binary
+            ),
+        ),
+    ]
+
+
+def main():
+    text = open(os.devnull, "w")
+    binary = open(os.devnull, "wb")
+    for target, files in [
+        ("/dev/null", (text, binary)),
+        ("slow stdout", (SlowFile(text), SlowFile(binary))),
+    ]:
+        for name, configure in setups(*files):
+            configure()
+            logger = structlog.get_logger(LOGGER_NAME)
+
+            def run():
+                for _ in range(REQUESTS):
+                    handle_request(logger)
+
+            timings = []
+            for _ in range(ROUNDS):
+                timings.append(timeit.timeit(run, number=1))
+                writer = wait_for_writer()
+
+            dropped = f"  dropped {writer.dropped}" if writer is not None else ""
+            per_request = min(timings) / REQUESTS * 1e6
+            print(f"{target:<12} {name:<22} {per_request:8.1f} us/request{dropped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Measures the time to score every plan of a large index against a user's
+favourites, and to build the index in the first place.
+
+    python -m benchmarks.bench_recommendations
+"""
+import random
+import time
+import timeit
+from uuid import uuid4
+from app.api.recommendations.index import PlanIndex
+from app.api.trainers.models import Difficulty
+
+PLANS = 500_000
+TRAINING_TYPES = [f"type_{i}" for i in range(30)]
+FAVOURITES = 20
+ROUNDS = 20
+
+
+def plan_document() -> dict:
+    """A plan with the fields the index reads"""
+    return {
+        "_id": str(uuid4()),
+        "difficulty": random.choice(list(Difficulty)).value,
+        "training_types": random.sample(TRAINING_TYPES, random.randint(1, 4)),
+        "duration": random.randint(10, 180),
+        "favourite_count": int(random.paretovariate(1.5)),
+        "blocked": random.random() < 0.01,
+    }
+
+
+def main():
+    random.seed(0)
+    plans = [plan_document() for _ in range(PLANS)]
+
+    start = time.perf_counter()
+    index = PlanIndex()
+    for plan in plans:
+        index.upsert(plan)
+    print(f"{PLANS:>7} plans  build     {time.perf_counter() - start:8.2f} s")
+
+    liked = [plan["_id"] for plan in random.sample(plans, FAVOURITES)]
+    for k in [10, 100]:
+        seconds = min(
+            timeit.repeat(lambda: index.recommend(liked, k), number=1, repeat=ROUNDS)
+        )
+        print(f"{PLANS:>7} plans  top {k:<5} {seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compares the cost of rendering plan listings through FastAPI's default
+response path and through TrustedJSONResponse.
+
+    python -m benchmarks.bench_serialization
+"""
+import json
+import timeit
+from datetime import datetime, timezone
+from uuid import uuid4
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from app.api.responses import TrustedJSONResponse
+from app.api.trainers.models import TrainingPlan, plan_view
+
+GOALS_PER_PLAN = 50
+ROUNDS = 20
+
+
+def plan_document() -> dict:
+    """A plan as it's stored, with its counters and a large goals list"""
+    return {
+        "_id": str(uuid4()),
+        "trainer": str(uuid4()),
+        "title": "Sample training plan",
+        "description": "Training plan description " * 10,
+        "difficulty": "intermediate",
+        "training_types": ["cardio", "hiit", "strength"],
+        "goals": [
+            {
+                "name": f"goal {i}",
+                "category": "Repeticiones",
+                "amount": str(i),
+                "media": ["imagen.com", "video.com"],
+            }
+            for i in range(GOALS_PER_PLAN)
+        ],
+        "duration": 90,
+        "blocked": False,
+        "favourite_count": 12,
+        "review_count": 4,
+        "review_score_sum": 17,
+        "version": 3,
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def default_response(plans: list[dict]) -> bytes:
+    # What FastAPI does with a returned list: validate it against the
+    # response_model, encode it and render it with the stdlib
+    validated = parse_obj_as(list[TrainingPlan], plans)
+    content = jsonable_encoder(validated, by_alias=True)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def trusted_response(plans: list[dict]) -> bytes:
+    return TrustedJSONResponse(content=[plan_view(plan) for plan in plans]).body
+
+
+def main():
+    for size in [25, 1000]:
+        plans = [plan_document() for _ in range(size)]
+        assert json.loads(default_response(plans)) == json.loads(
+            trusted_response(plans)
+        )
+
+        for name, render in [
+            ("default", default_response),
+            ("trusted", trusted_response),
+        ]:
+            seconds = min(timeit.repeat(lambda: render(plans), number=1, repeat=ROUNDS))
+            print(f"{size:>5} plans  {name:<8} {seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+from app.main import app
+from httpx import AsyncClient
+from starlette import status
+from tests.conftest import plan
+import asyncio
+import json
+import pytest
+
+
+@pytest.mark.anyio
+async def test_export_plans_as_ndjson():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        for title in ["first", "second", "third"]:
+            await ac.post("/plans", json=plan(title))
+
+        params = {"fields": "title"}
+        response = await ac.get("/admin/export/plans", params=params)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    plans = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(plan["title"] for plan in plans) == ["first", "second", "third"]
+    assert all(set(plan) == {"_id", "title"} for plan in plans)
+
+
+@pytest.mark.anyio
+async def test_export_plans_updated_since():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan("old"))
+        id = response.json()["_id"]
+        await ac.post("/plans", json=plan("unchanged"))
+        await asyncio.sleep(0.01)
+        since = datetime.now(timezone.utc)
+        await asyncio.sleep(0.01)
+        await ac.put(f"/plans/{id}", json={"title": "updated"})
+
+        params = {"updated_since": since.isoformat()}
+        response = await ac.get("/admin/export/plans", params=params)
+
+    plans = [json.loads(line) for line in response.text.splitlines()]
+    assert [plan["_id"] for plan in plans] == [id]
+
+
+@pytest.mark.anyio
+async def test_import_plans_reports_invalid_lines():
+    lines = [json.dumps(plan("first")), "{not json", json.dumps({"title": "x"})]
+    lines = [line.encode() for line in lines] + [b'{"title": "\xff"}']
+    lines.append(json.dumps(plan("second")).encode())
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/admin/import/plans", content=b"\n".join(lines))
+        assert response.status_code == status.HTTP_200_OK
+        report = response.json()
+
+        response = await ac.get("/plans")
+
+    assert report["inserted"] == 2
+    assert report["failed"] == 3
+    assert [error["line"] for error in report["errors"]] == [2, 3, 4]
+    assert sorted(plan["title"] for plan in response.json()) == ["first", "second"]
+
+
+@pytest.mark.anyio
+async def test_import_reviews_updates_plan_counters():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan("reviewed"))
+        plan_id = response.json()["_id"]
+
+        reviews = [
+            {"plan_id": plan_id, "user_id": "user_1", "score": 5},
+            {"plan_id": plan_id, "user_id": "user_2", "score": 2},
+            {"plan_id": plan_id, "user_id": "user_1", "score": 1},
+        ]
+        content = "\n".join(json.dumps(review) for review in reviews)
+        response = await ac.post("/admin/import/reviews", content=content)
+        report = response.json()
+
+        response = await ac.get(f"/reviews/{plan_id}/mean")
+
+    assert report["inserted"] == 2
+    assert report["errors"] == [{"line": 3, "error": "review already exists"}]
+    assert response.json()["mean"] == pytest.approx(3.5)
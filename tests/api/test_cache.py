@@ -0,0 +1,179 @@
+from app.api.cache import EntityCache, ListingCache
+from app.main import app
+from httpx import AsyncClient
+from starlette import status
+import asyncio
+import pytest
+import time
+
+
+def test_cache_evicts_least_recently_used_entries():
+    cache = EntityCache(max_entries=2, max_bytes=1024, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats.evictions == 1
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 1
+
+
+def test_cache_is_bounded_in_bytes():
+    cache = EntityCache(max_entries=100, max_bytes=30, ttl=60)
+    cache.set("a", "x" * 10)
+    cache.set("b", "x" * 10)
+    cache.set("c", "x" * 10)
+    cache.set("too big", "x" * 40)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "x" * 10
+    assert cache.get("c") == "x" * 10
+    assert cache.get("too big") is None
+    assert cache.size <= 30
+
+
+def test_cache_entries_expire(monkeypatch):
+    cache = EntityCache(max_entries=10, max_bytes=1024, ttl=5)
+    cache.set("a", 1)
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_bumping_the_generation_makes_listings_stale():
+    cache = ListingCache(max_entries=10, max_bytes=1024, ttl=60)
+    cache.set("plans", [1, 2])
+    assert cache.get("plans") == [1, 2]
+
+    cache.bump()
+    assert cache.get("plans") is None
+
+
+def test_values_loaded_before_an_invalidation_are_not_cached():
+    cache = EntityCache(max_entries=10, max_bytes=1024, ttl=60)
+    epoch = cache.epoch("a")
+    cache.invalidate("a")
+    cache.set("a", "stale", epoch)
+
+    assert cache.get("a") is None
+    cache.set("a", "fresh", cache.epoch("a"))
+    assert cache.get("a") == "fresh"
+
+
+class PausedCollection:
+    """Collection whose first find_one waits for the test once it has read"""
+
+    def __init__(self, collection, reading: asyncio.Event, resume: asyncio.Event):
+        self.collection = collection
+        self.reading = reading
+        self.resume = resume
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def find_one(self, *args, **kwargs):
+        document = await self.collection.find_one(*args, **kwargs)
+        if not self.reading.is_set():
+            self.reading.set()
+            await self.resume.wait()
+        return document
+
+
+class PausedDatabase:
+    def __init__(self, db):
+        self.db = db
+        self.reading = asyncio.Event()
+        self.resume = asyncio.Event()
+
+    def __getitem__(self, name):
+        return PausedCollection(self.db[name], self.reading, self.resume)
+
+
+@pytest.mark.anyio
+async def test_a_read_racing_a_write_does_not_cache_the_old_plan(monkeypatch):
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        id = (await ac.post("/plans", json=plan)).json()["_id"]
+        db = PausedDatabase(app.mongodb)
+        monkeypatch.setattr(app, "mongodb", db)
+
+        before_write = asyncio.ensure_future(ac.get(f"/plans/{id}"))
+        await db.reading.wait()
+        await ac.put(f"/plans/{id}", json={"title": "Updated training plan"})
+        after_write = asyncio.ensure_future(ac.get(f"/plans/{id}"))
+        await asyncio.sleep(0.05)
+        db.resume.set()
+
+        assert (await before_write).json()["title"] == "Pilates training plan"
+        assert (await after_write).json()["title"] == "Updated training plan"
+        response = await ac.get(f"/plans/{id}")
+
+    assert response.json()["title"] == "Updated training plan"
+
+
+@pytest.mark.anyio
+async def test_updating_a_plan_invalidates_its_cached_copy():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan)
+        id = response.json()["_id"]
+
+        await ac.get(f"/plans/{id}")
+        await ac.put(f"/plans/{id}", json={"title": "Updated training plan"})
+        response = await ac.get(f"/plans/{id}")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"] == "Updated training plan"
+
+
+@pytest.mark.anyio
+async def test_equivalent_plan_filters_share_a_cached_listing():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio", "pilates"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan)
+        id = response.json()["_id"]
+
+        response = await ac.get("/plans?types=cardio&types=pilates")
+        assert response.headers["X-Cache"] == "MISS"
+        response = await ac.get("/plans?types=pilates&types=cardio")
+        assert response.headers["X-Cache"] == "HIT"
+        assert len(response.json()) == 1
+
+        await ac.put(f"/plans/{id}", json={"training_types": ["cardio"]})
+        response = await ac.get("/plans?types=pilates&types=cardio")
+
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json() == []
@@ -0,0 +1,123 @@
+from datetime import datetime
+from app.config.database import (
+    FAVOURITES_COLLECTION_NAME,
+    REVIEWS_COLLECTION_NAME,
+    TRAININGS_COLLECTION_NAME,
+)
+from app.config.indexes import check_unique_indexes, ensure_indexes
+from app.main import app
+import pytest
+
+
+def has_stage(plan, stage: str) -> bool:
+    if isinstance(plan, list):
+        return any(has_stage(p, stage) for p in plan)
+    if not isinstance(plan, dict):
+        return False
+    if plan.get("stage") == stage:
+        return True
+    return any(has_stage(value, stage) for value in plan.values())
+
+
+def uses_index(plan) -> bool:
+    return has_stage(plan, "IXSCAN")
+
+
+async def winning_plan(collection: str, query: dict) -> dict:
+    explanation = await app.mongodb[collection].find(query).explain()
+    return explanation["queryPlanner"]["winningPlan"]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "collection,query",
+    [
+        (
+            REVIEWS_COLLECTION_NAME,
+            {"$and": [{"plan_id": "plan_id"}, {"user_id": "user_id"}]},
+        ),
+        (REVIEWS_COLLECTION_NAME, {"plan_id": "plan_id"}),
+        (TRAININGS_COLLECTION_NAME, {"trainer": "trainer"}),
+        (
+            TRAININGS_COLLECTION_NAME,
+            {"$and": [{"blocked": False}, {"trainer": "trainer"}]},
+        ),
+        (FAVOURITES_COLLECTION_NAME, {"user_id": "user_id"}),
+        (FAVOURITES_COLLECTION_NAME, {"plan_id": "plan_id"}),
+        (TRAININGS_COLLECTION_NAME, {"$and": [{"difficulty": "beginner"}]}),
+        (TRAININGS_COLLECTION_NAME, {"$and": [{"training_types": {"$all": ["hiit"]}}]}),
+        (TRAININGS_COLLECTION_NAME, {"$and": [{"blocked": False}]}),
+        (
+            TRAININGS_COLLECTION_NAME,
+            {
+                "$and": [
+                    {"difficulty": "beginner"},
+                    {"training_types": {"$all": ["hiit", "cardio"]}},
+                    {"blocked": False},
+                ]
+            },
+        ),
+        (TRAININGS_COLLECTION_NAME, {"updated_at": {"$gte": datetime(2023, 1, 1)}}),
+        (REVIEWS_COLLECTION_NAME, {"updated_at": {"$gte": datetime(2023, 1, 1)}}),
+        (
+            TRAININGS_COLLECTION_NAME,
+            {"$text": {"$search": "pilates"}, "blocked": False},
+        ),
+    ],
+)
+async def test_crud_queries_use_an_index(test_app, collection, query):
+    await ensure_indexes(app.mongodb)
+    await app.mongodb[collection].insert_one({"_id": "document"})
+
+    assert uses_index(await winning_plan(collection, query))
+
+
+@pytest.mark.anyio
+async def test_missing_unique_indexes_are_fatal(test_app):
+    await check_unique_indexes(app.mongodb)
+
+    await app.mongodb[REVIEWS_COLLECTION_NAME].drop_index("plan_id_1_user_id_1")
+    with pytest.raises(RuntimeError, match="reviews.plan_id_1_user_id_1"):
+        await check_unique_indexes(app.mongodb)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"$and": [{"difficulty": "beginner"}, {"blocked": False}]},
+        {"$and": [{"training_types": {"$all": ["hiit"]}}, {"blocked": False}]},
+        {
+            "$and": [
+                {"difficulty": "beginner"},
+                {"training_types": {"$all": ["hiit", "cardio"]}},
+                {"blocked": False},
+                {"_id": {"$gt": "cursor"}},
+            ]
+        },
+        {"$and": [{"blocked": False}, {"trainer": "trainer"}]},
+        # Admins see the blocked plans too
+        {"trainer": "trainer"},
+        {"$and": [{"_id": {"$gt": "cursor"}}, {"trainer": "trainer"}]},
+        {"$and": [{"difficulty": "beginner"}]},
+        {"$and": [{"training_types": {"$all": ["hiit"]}}]},
+        {
+            "$and": [
+                {"difficulty": "beginner"},
+                {"training_types": {"$all": ["hiit", "cardio"]}},
+                {"_id": {"$gt": "cursor"}},
+            ]
+        },
+    ],
+)
+async def test_plan_pages_are_not_sorted_in_memory(test_app, query):
+    await ensure_indexes(app.mongodb)
+    explanation = (
+        await app.mongodb[TRAININGS_COLLECTION_NAME]
+        .find(query, sort=[("_id", 1)], limit=25)
+        .explain()
+    )
+    plan = explanation["queryPlanner"]["winningPlan"]
+
+    assert uses_index(plan)
+    assert not has_stage(plan, "SORT")
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+from app.api.leaderboards.crud import bayesian_average, rebuild_rankings
+from app.config.database import RANKINGS_COLLECTION_NAME
+from app.main import app
+from httpx import AsyncClient
+from starlette import status
+from tests.conftest import plan
+import pytest
+
+
+def test_bayesian_average_needs_many_reviews_to_move_away_from_the_prior():
+    one_review = bayesian_average(1, 5, prior_mean=3)
+    many_reviews = bayesian_average(100, 450, prior_mean=3)
+
+    assert 3 < one_review < many_reviews < 4.5
+
+
+@pytest.mark.anyio
+async def test_top_leaderboard_ranks_by_bayesian_average():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        single = (await ac.post("/plans", json=plan("single"))).json()["_id"]
+        many = (await ac.post("/plans", json=plan("many"))).json()["_id"]
+        advanced = plan("advanced", "advanced")
+        other = (await ac.post("/plans", json=advanced)).json()["_id"]
+
+        await ac.post("/reviews", json={"plan_id": single, "user_id": "u", "score": 5})
+        for i in range(20):
+            review = {"plan_id": many, "user_id": f"user_{i}", "score": 4 + i % 2}
+            await ac.post("/reviews", json=review)
+            review = {"plan_id": other, "user_id": f"user_{i}", "score": 1}
+            await ac.post("/reviews", json=review)
+        await app.leaderboard_refresher.rebuild()
+
+        response = await ac.get("/leaderboards/top")
+        assert response.status_code == status.HTTP_200_OK
+        assert [entry["_id"] for entry in response.json()] == [many, single, other]
+
+        response = await ac.get("/leaderboards/top", params={"difficulty": "advanced"})
+        assert [entry["_id"] for entry in response.json()] == [other]
+
+
+@pytest.mark.anyio
+async def test_trending_leaderboard_is_refreshed_incrementally():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        first = (await ac.post("/plans", json=plan("first"))).json()["_id"]
+        second = (await ac.post("/plans", json=plan("second"))).json()["_id"]
+        await app.leaderboard_refresher.rebuild()
+
+        for user in ["user_1", "user_2"]:
+            favourite = {"training_id": second}
+            await ac.post(f"/users/{user}/trainings/favourites", json=favourite)
+        await app.leaderboard_refresher.refresh()
+
+        response = await ac.get("/leaderboards/trending")
+        assert [entry["_id"] for entry in response.json()] == [second, first]
+        assert response.json()[0]["trend"] == 2
+
+        await ac.patch("/plans", json=[{"uid": second, "blocked": True}])
+        await app.leaderboard_refresher.refresh()
+        response = await ac.get("/leaderboards/trending")
+
+    assert [entry["_id"] for entry in response.json()] == [first]
+
+
+class LateRankings:
+    """Rankings collection that an older rebuild writes to again right after
+    this one does, as if it had been slower"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def bulk_write(self, requests, **kwargs):
+        await self.collection.bulk_write(requests, **kwargs)
+        earlier = datetime.now(timezone.utc) - timedelta(minutes=1)
+        await self.collection.update_many(
+            {}, {"$set": {"refreshed_at": earlier, "rebuild_id": "older"}}
+        )
+
+
+class LateDatabase:
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, name):
+        if name == RANKINGS_COLLECTION_NAME:
+            return LateRankings(self.db[name])
+        return self.db[name]
+
+
+@pytest.mark.anyio
+async def test_concurrent_rebuilds_keep_each_others_rankings():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        live = (await ac.post("/plans", json=plan("live"))).json()["_id"]
+        blocked = (await ac.post("/plans", json=plan("blocked"))).json()["_id"]
+        await app.leaderboard_refresher.rebuild()
+        await ac.patch("/plans", json=[{"uid": blocked, "blocked": True}])
+
+        await rebuild_rankings(LateDatabase(app.mongodb))
+        response = await ac.get("/leaderboards/top")
+
+    assert [entry["_id"] for entry in response.json()] == [live]
@@ -0,0 +1,68 @@
+from app.config.config import get_processors
+from app.config.logs import EventSampler, QueueWriter, parse_sample_rates
+import io
+import json
+import threading
+import pytest
+import structlog
+
+
+def test_sample_rates_are_parsed_by_event():
+    rates = parse_sample_rates("retrieved plan=0.1, added favourite=1,")
+
+    assert rates == {"retrieved plan": 0.1, "added favourite": 1.0}
+
+
+def test_sampler_only_drops_info_lines_of_sampled_events():
+    sampler = EventSampler({"retrieved plan": 0.0, "updated plan": 1.0})
+
+    with pytest.raises(structlog.DropEvent):
+        sampler(None, "info", {"event": "retrieved plan"})
+    assert sampler(None, "warning", {"event": "retrieved plan"}) == {
+        "event": "retrieved plan"
+    }
+    assert sampler(None, "info", {"event": "updated plan"})["sample_rate"] == 1.0
+    assert "sample_rate" not in sampler(None, "info", {"event": "other"})
+
+
+def test_queue_writer_drops_lines_instead_of_blocking():
+    file = io.BytesIO()
+    writer = QueueWriter(file, max_lines=1)
+    # Fills the queue faster than the thread can empty it
+    for i in range(1000):
+        writer.write(f"line {i}".encode())
+    writer.close()
+
+    lines = file.getvalue().splitlines()
+    assert lines[0] == b"line 0"
+    assert len(lines) + writer.dropped == 1000
+
+
+def test_queue_writer_counts_drops_from_every_thread():
+    file = io.BytesIO()
+    writer = QueueWriter(file, max_lines=1)
+
+    def write():
+        for i in range(1000):
+            writer.write(b"line")
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    assert len(file.getvalue().splitlines()) + writer.dropped == 4000
+
+
+def test_json_lines_can_have_keys_that_are_not_strings():
+    file = io.BytesIO()
+    logger = structlog.wrap_logger(
+        structlog.BytesLogger(file), processors=get_processors("json", {})
+    )
+    logger.info("hi", d={1: 2})
+
+    line = json.loads(file.getvalue())
+    assert line["event"] == "hi"
+    assert line["d"] == {"1": 2}
@@ -0,0 +1,65 @@
+from app.api.metrics import dispatcher
+from app.api.metrics.dispatcher import MetricsDispatcher
+from app.api.metrics.service import Metrics, MetricsService
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+
+    async def fake_get_metrics(db, plan_id):
+        return Metrics(plan_id=plan_id)
+
+    async def fake_send(self, metrics):
+        sent.append(metrics.plan_id)
+
+    monkeypatch.setattr(dispatcher, "get_metrics", fake_get_metrics)
+    monkeypatch.setattr(dispatcher.MetricsService, "send", fake_send)
+    return sent
+
+
+@pytest.mark.anyio
+async def test_dispatcher_merges_updates_of_the_same_plan(sent):
+    metrics_dispatcher = MetricsDispatcher(
+        None, MetricsService(None), queue_size=10, window=0.05
+    )
+    metrics_dispatcher.start()
+
+    for _ in range(100):
+        metrics_dispatcher.submit("plan_1")
+    metrics_dispatcher.submit("plan_2")
+
+    await asyncio.sleep(0.2)
+    await metrics_dispatcher.stop()
+
+    assert sorted(sent) == ["plan_1", "plan_2"]
+
+
+@pytest.mark.anyio
+async def test_dispatcher_drains_pending_updates_on_stop(sent):
+    metrics_dispatcher = MetricsDispatcher(
+        None, MetricsService(None), queue_size=10, window=60
+    )
+    metrics_dispatcher.start()
+
+    metrics_dispatcher.submit("plan_1")
+    metrics_dispatcher.submit("plan_2")
+    await asyncio.sleep(0)
+    await metrics_dispatcher.stop()
+
+    assert sorted(sent) == ["plan_1", "plan_2"]
+
+
+@pytest.mark.anyio
+async def test_dispatcher_drops_updates_when_queue_is_full(sent):
+    metrics_dispatcher = MetricsDispatcher(
+        None, MetricsService(None), queue_size=1, window=60
+    )
+
+    metrics_dispatcher.submit("plan_1")
+    metrics_dispatcher.submit("plan_2")
+    await metrics_dispatcher.stop()
+
+    assert sent == ["plan_1"]
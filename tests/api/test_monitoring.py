@@ -0,0 +1,172 @@
+import json
+from types import SimpleNamespace
+from app.api.monitoring.listener import MongoCommandMetrics
+from app.api.monitoring.middleware import current_route
+from app.api.monitoring.profiler import SlowQueryProfiler, command_shape
+from app.main import app
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+from starlette import status
+import pytest
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def command_events(request_id: int, command_name: str, command: dict, **ended):
+    connection_id = ("localhost", 27017)
+    started = SimpleNamespace(
+        command=command,
+        command_name=command_name,
+        connection_id=connection_id,
+        request_id=request_id,
+    )
+    ended = SimpleNamespace(
+        command_name=command_name,
+        connection_id=connection_id,
+        request_id=request_id,
+        **ended,
+    )
+    return started, ended
+
+
+@pytest.mark.anyio
+async def test_requests_are_counted_by_route_template():
+    labels = {"method": "GET", "route": "/plans/{plan_id}"}
+    before = sample("http_requests_total", status="404", **labels)
+    observed = sample("http_request_duration_seconds_count", **labels)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        for plan_id in ["first", "second"]:
+            await ac.get(f"/plans/{plan_id}")
+        await ac.get("/not/a/route")
+        response = await ac.get("/metrics")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert sample("http_requests_total", status="404", **labels) == before + 2
+    assert sample("http_request_duration_seconds_count", **labels) == observed + 2
+    assert sample("http_requests_in_progress", **labels) == 0
+    assert 'route="unmatched"' in response.text
+    assert 'cache_entries{cache="entity"}' in response.text
+
+
+def test_mongo_commands_are_timed_by_collection():
+    listener = MongoCommandMetrics()
+    labels = {"collection": "trainings", "command": "find"}
+    before = sample("mongodb_command_duration_seconds_count", **labels)
+    failures = sample("mongodb_command_failures_total", **labels)
+
+    command = {"find": "trainings", "filter": {}}
+    succeeded = command_events(1, "find", command, duration_micros=1500)
+    failed = command_events(2, "find", command, duration_micros=500)
+    listener.started(succeeded[0])
+    listener.started(failed[0])
+    listener.succeeded(succeeded[1])
+    listener.failed(failed[1])
+
+    assert sample("mongodb_command_duration_seconds_count", **labels) == before + 2
+    assert sample("mongodb_command_failures_total", **labels) == failures + 1
+    assert listener._collections == {}
+
+
+def test_command_shape_strips_the_values():
+    command = {
+        "find": "trainings",
+        "filter": {"blocked": False, "_id": {"$in": ["a", "b", "c"]}},
+        "sort": {"_id": 1},
+        "limit": 25,
+    }
+    update = {"update": "trainings", "updates": [{"q": {"_id": "a"}, "u": {}}]}
+    insert = {"insert": "trainings", "documents": [{"_id": "a", "title": "b"}]}
+    pipeline = [{"$match": {"plan_id": "a"}}, {"$sort": {"score": -1}}]
+
+    assert json.loads(command_shape("find", command)) == {
+        "filter": {"blocked": "?", "_id": {"$in": "?"}},
+        "sort": {"_id": 1},
+    }
+    assert json.loads(command_shape("update", update)) == {
+        "updates": {"q": {"_id": "?"}, "u": {}}
+    }
+    assert json.loads(command_shape("insert", insert)) == {
+        "documents": {"_id": "?", "title": "?"}
+    }
+    assert json.loads(command_shape("aggregate", {"pipeline": pipeline})) == {
+        "pipeline": [{"$match": {"plan_id": "?"}}, {"$sort": {"score": -1}}]
+    }
+
+
+@pytest.mark.anyio
+async def test_slow_queries_are_ranked_by_shape():
+    profiler = app.slow_query_profiler
+    threshold_ms = profiler.threshold_ms
+    profiler.threshold_ms = 10
+    fast = {"find": "trainings", "filter": {"_id": "a"}}
+    by_id = {"find": "trainings", "filter": {"_id": "b"}}
+    by_type = {"find": "trainings", "filter": {"training_types": "cardio"}}
+    reply = {"cursor": {"firstBatch": [{}, {}]}}
+    try:
+        current_route.set("GET /plans")
+        for request_id, command, duration_ms in [
+            (1, fast, 1),
+            (2, by_id, 20),
+            (3, by_id, 40),
+            (4, by_type, 100),
+        ]:
+            started, ended = command_events(
+                request_id,
+                "find",
+                command,
+                reply=reply,
+                duration_micros=duration_ms * 1000,
+            )
+            profiler.started(started)
+            profiler.succeeded(ended)
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/admin/slow-queries", params={"limit": 2})
+    finally:
+        profiler.threshold_ms = threshold_ms
+        current_route.set(None)
+
+    assert response.status_code == status.HTTP_200_OK
+    shapes = response.json()
+    assert [json.loads(shape["shape"]) for shape in shapes] == [
+        {"filter": {"training_types": "?"}},
+        {"filter": {"_id": "?"}},
+    ]
+    assert shapes[1]["count"] == 2
+    assert shapes[1]["mean_ms"] == 30
+    assert shapes[1]["max_docs_returned"] == 2
+    assert shapes[1]["routes"] == ["GET /plans"]
+
+
+def test_get_more_takes_the_shape_of_the_command_that_opened_the_cursor():
+    profiler = SlowQueryProfiler(threshold_ms=10, window=60, max_entries=10)
+    find = {"find": "trainings", "filter": {"blocked": False}, "sort": {"_id": 1}}
+    get_more = {"getMore": 42, "collection": "trainings"}
+    for request_id, command_name, command, cursor_id, duration_ms in [
+        (1, "find", find, 42, 1),
+        (2, "getMore", get_more, 42, 20),
+        (3, "getMore", get_more, 0, 20),
+    ]:
+        reply = {"cursor": {"id": cursor_id, "nextBatch": [{}]}}
+        started, ended = command_events(
+            request_id,
+            command_name,
+            command,
+            reply=reply,
+            duration_micros=duration_ms * 1000,
+        )
+        profiler.started(started)
+        profiler.succeeded(ended)
+
+    [shape] = profiler.top(10)
+    assert shape["command"] == "getMore"
+    assert shape["count"] == 2
+    assert json.loads(shape["shape"]) == {
+        "filter": {"blocked": "?"},
+        "sort": {"_id": 1},
+    }
+    assert profiler._cursors == {}
@@ -0,0 +1,106 @@
+from datetime import timedelta
+from app.api.recommendations.index import PlanIndex
+from app.config.database import TRAININGS_COLLECTION_NAME
+from app.main import app
+from httpx import AsyncClient
+from starlette import status
+from tests.conftest import plan
+import pytest
+
+
+def test_plan_index_reuses_the_rows_of_removed_plans():
+    index = PlanIndex(capacity=2)
+    for i in range(3):
+        document = plan(f"plan_{i}", "beginner", [f"type_{i}"], 30)
+        index.upsert({"_id": f"plan_{i}", **document})
+    index.remove("plan_1")
+    index.upsert({"_id": "plan_3", **plan("plan_3", "beginner", ["type_1"], 30)})
+
+    assert len(index) == 3
+    assert index.rows["plan_3"] == 1
+    assert index.recommend(["plan_3"], 1) == ["plan_0"]
+
+
+@pytest.mark.anyio
+async def test_recommendations_are_similar_to_the_favourites():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        liked = plan("liked", "beginner", ["cardio", "hiit"], 30)
+        liked = (await ac.post("/plans", json=liked)).json()["_id"]
+        similar = plan("similar", "beginner", ["cardio"], 40)
+        similar = (await ac.post("/plans", json=similar)).json()["_id"]
+        other = plan("other", "advanced", ["strength"], 120)
+        other = (await ac.post("/plans", json=other)).json()["_id"]
+        blocked = plan("blocked", "beginner", ["cardio", "hiit"], 30)
+        blocked = (await ac.post("/plans", json=blocked)).json()["_id"]
+        await ac.patch("/plans", json=[{"uid": blocked, "blocked": True}])
+
+        favourite = {"training_id": liked}
+        await ac.post("/users/user_1/trainings/favourites", json=favourite)
+        await app.plan_index_refresher.rebuild()
+
+        response = await ac.get("/users/user_1/recommendations")
+        assert response.status_code == status.HTTP_200_OK
+        assert [plan["_id"] for plan in response.json()] == [similar, other]
+
+        response = await ac.get("/users/user_1/recommendations", params={"limit": 1})
+        assert [plan["_id"] for plan in response.json()] == [similar]
+
+
+@pytest.mark.anyio
+async def test_recommendations_are_refreshed_incrementally():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        first = plan("first", "beginner", ["cardio"], 30)
+        first = (await ac.post("/plans", json=first)).json()["_id"]
+        await app.plan_index_refresher.rebuild()
+
+        second = plan("second", "beginner", ["cardio"], 30)
+        second = (await ac.post("/plans", json=second)).json()["_id"]
+        await ac.post(
+            "/users/user_1/trainings/favourites", json={"training_id": second}
+        )
+        await app.plan_index_refresher.refresh()
+
+        # Without favourites, the most popular plans come first
+        response = await ac.get("/users/user_2/recommendations")
+        assert [plan["_id"] for plan in response.json()] == [second, first]
+
+        await ac.delete(f"/plans/trainer/{second}")
+        await app.plan_index_refresher.refresh()
+        response = await ac.get("/users/user_2/recommendations")
+
+    assert [plan["_id"] for plan in response.json()] == [first]
+
+
+@pytest.mark.anyio
+async def test_recommendations_skip_plans_blocked_since_the_last_refresh():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        best = plan("best", "beginner", ["cardio"], 30)
+        best = (await ac.post("/plans", json=best)).json()["_id"]
+        await ac.post("/users/user_1/trainings/favourites", json={"training_id": best})
+        second = plan("second", "beginner", ["cardio"], 30)
+        second = (await ac.post("/plans", json=second)).json()["_id"]
+        await app.plan_index_refresher.rebuild()
+
+        await ac.patch("/plans", json=[{"uid": best, "blocked": True}])
+        response = await ac.get("/users/user_2/recommendations", params={"limit": 1})
+
+    assert [plan["_id"] for plan in response.json()] == [second]
+
+
+@pytest.mark.anyio
+async def test_refresh_reads_writes_that_show_up_late():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        first = plan("first", "beginner", ["cardio"], 30)
+        first = (await ac.post("/plans", json=first)).json()["_id"]
+        await app.plan_index_refresher.rebuild()
+
+        # Stamped before the last write the index has seen, but only
+        # committed after it was read
+        stamped = app.plan_index_refresher._since - timedelta(seconds=1)
+        late = plan("late", "beginner", ["cardio"], 30)
+        await app.mongodb[TRAININGS_COLLECTION_NAME].insert_one(
+            {"_id": "late", **late, "blocked": False, "updated_at": stamped}
+        )
+        await app.plan_index_refresher.refresh()
+
+    assert "late" in app.plan_index_refresher.index.rows
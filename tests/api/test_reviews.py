@@ -1,4 +1,9 @@
-from starlette.status import HTTP_409_CONFLICT
+from app.config.database import TRAININGS_COLLECTION_NAME
+from app.main import app
+from httpx import AsyncClient
+from starlette.status import HTTP_201_CREATED, HTTP_409_CONFLICT
+from tests.conftest import create_plan
+import asyncio
 import pytest
 
 
@@ -118,3 +123,117 @@ async def test_create_review_with_invalid_score(test_app):
 
     response = test_app.post("/reviews", json=review_2)
     assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_reviews_update_plan_counters(test_app):
+    plan_id = create_plan(test_app)
+    for user, score in [("user_1", 5), ("user_2", 2)]:
+        review = {"plan_id": plan_id, "user_id": user, "score": score}
+        response = test_app.post("/reviews", json=review)
+        assert response.status_code == 201
+    review_id = response.json()["_id"]
+
+    response = test_app.put(f"/reviews/{review_id}", json={"score": 4})
+    assert response.status_code == 200
+    assert response.json()["score"] == 4
+
+    plan = await app.mongodb[TRAININGS_COLLECTION_NAME].find_one({"_id": plan_id})
+    assert plan["review_count"] == 2
+    assert plan["review_score_sum"] == 9
+
+    response = test_app.get(f"/reviews/{plan_id}/mean")
+    assert response.json()["mean"] == pytest.approx(4.5)
+
+
+@pytest.mark.anyio
+async def test_concurrent_reviews_of_the_same_user_create_only_one(test_app):
+    review = {
+        "plan_id": "c59710ef-f5d0-41ba-a787-ad8eb739ef4c",
+        "user_id": "7ca0fa95-af47-40b4-8e39-2fae5ee2667a",
+        "review": "Very good training",
+        "score": 2,
+    }
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        responses = await asyncio.gather(
+            *[ac.post("/reviews", json=review) for _ in range(5)]
+        )
+
+    status_codes = sorted(response.status_code for response in responses)
+    assert status_codes == [HTTP_201_CREATED] + [HTTP_409_CONFLICT] * 4
+
+
+@pytest.mark.anyio
+async def test_page_through_reviews_with_a_cursor(test_app):
+    plan_id = "c59710ef-f5d0-41ba-a787-ad8eb739ef4c"
+    for user in ["user_1", "user_2", "user_3"]:
+        review = {"plan_id": plan_id, "user_id": user, "score": 3}
+        test_app.post("/reviews", json=review)
+
+    response = test_app.get(f"/reviews/{plan_id}", params={"limit": 2})
+    body = response.json()
+    assert len(body["reviews"]) == 2
+    assert body["next_cursor"] is not None
+
+    params = {"limit": 2, "cursor": body["next_cursor"]}
+    response = test_app.get(f"/reviews/{plan_id}", params=params)
+    body = response.json()
+    assert len(body["reviews"]) == 1
+    assert body["next_cursor"] is None
+
+
+@pytest.mark.anyio
+async def test_get_reviews_answers_not_modified_while_unchanged(test_app):
+    plan_id = create_plan(test_app)
+    review = {"plan_id": plan_id, "user_id": "user_1", "score": 3}
+    test_app.post("/reviews", json=review)
+
+    response = test_app.get(f"/reviews/{plan_id}")
+    etag = response.headers["ETag"]
+    headers = {"If-None-Match": etag}
+    response = test_app.get(f"/reviews/{plan_id}", headers=headers)
+    assert response.status_code == 304
+
+    review_id = test_app.get(f"/reviews/{plan_id}").json()["reviews"][0]["_id"]
+    update = {"review": "Changed my mind", "score": 3}
+    test_app.put(f"/reviews/{review_id}", json=update)
+    response = test_app.get(f"/reviews/{plan_id}", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["reviews"][0]["review"] == "Changed my mind"
+
+
+@pytest.mark.anyio
+async def test_get_reviews_pages_have_their_own_etag(test_app):
+    plan_id = create_plan(test_app)
+    for user in ["user_1", "user_2"]:
+        review = {"plan_id": plan_id, "user_id": user, "score": 3}
+        test_app.post("/reviews", json=review)
+
+    response = test_app.get(f"/reviews/{plan_id}", params={"limit": 1})
+    headers = {"If-None-Match": response.headers["ETag"]}
+    params = {"limit": 1, "cursor": response.json()["next_cursor"]}
+    response = test_app.get(f"/reviews/{plan_id}", params=params, headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.json()["reviews"]) == 1
+
+
+@pytest.mark.anyio
+async def test_batch_review_stats(test_app):
+    reviewed = create_plan(test_app)
+    not_reviewed = create_plan(test_app)
+    for user, score in [("user_1", 5), ("user_2", 4), ("user_3", 5)]:
+        review = {"plan_id": reviewed, "user_id": user, "score": score}
+        test_app.post("/reviews", json=review)
+
+    body = {"plan_ids": [not_reviewed, reviewed]}
+    response = test_app.post("/reviews:batchStats", json=body)
+    assert response.status_code == 200
+
+    stats = response.json()["stats"]
+    assert [s["plan_id"] for s in stats] == [not_reviewed, reviewed]
+    assert stats[0]["count"] == 0
+    assert stats[1]["count"] == 3
+    assert stats[1]["mean"] == pytest.approx(14 / 3)
+    assert stats[1]["histogram"] == {"1": 0, "2": 0, "3": 0, "4": 1, "5": 2}
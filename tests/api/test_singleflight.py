@@ -0,0 +1,81 @@
+from app.api.singleflight import SingleFlight
+from app.main import app
+from httpx import AsyncClient
+import asyncio
+import pytest
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_for_the_same_key_are_collapsed():
+    singleflight = SingleFlight()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "plan"
+
+    results = await asyncio.gather(*[singleflight.do("a", load) for _ in range(10)])
+
+    assert results == ["plan"] * 10
+    assert calls == 1
+    assert singleflight.collapsed == 9
+    assert len(singleflight) == 0
+
+
+@pytest.mark.anyio
+async def test_failed_calls_are_not_reused():
+    singleflight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    async def load():
+        return "plan"
+
+    results = await asyncio.gather(
+        singleflight.do("a", fail), singleflight.do("a", fail), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    assert await singleflight.do("a", load) == "plan"
+
+
+@pytest.mark.anyio
+async def test_cancelled_caller_does_not_cancel_the_others():
+    singleflight = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.05)
+        return "plan"
+
+    first = asyncio.ensure_future(singleflight.do("a", load))
+    second = asyncio.ensure_future(singleflight.do("a", load))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "plan"
+    assert first.cancelled()
+
+
+@pytest.mark.anyio
+async def test_concurrent_plan_reads_are_collapsed(test_app):
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+    response = test_app.post("/plans", json=plan)
+    id = response.json()["_id"]
+
+    collapsed = app.singleflight.collapsed
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        responses = await asyncio.gather(*[ac.get(f"/plans/{id}") for _ in range(5)])
+
+    assert all(response.json()["_id"] == id for response in responses)
+    assert app.singleflight.collapsed > collapsed
@@ -1,4 +1,4 @@
-from app.config.database import TRAININGS_COLLECTION_NAME
+from app.config.database import FAVOURITES_COLLECTION_NAME, TRAININGS_COLLECTION_NAME
 from app.main import app
 from starlette import status
 from httpx import AsyncClient
@@ -22,6 +22,8 @@ def test_create_plan_without_errors(test_app):
 
     body = response.json()
     assert "_id" in body
+    assert "version" not in body
+    assert "favourite_count" not in body
 
 
 def test_plan_with_missing_field(test_app):
@@ -49,7 +51,6 @@ async def test_update_existing_plan():
         "goals": ["plank: one minute"],
         "duration": 90,
         "reviews": None,
-        "favourited_by": [],
     }
     async with AsyncClient(app=app, base_url="http://test") as ac:
         response = await ac.post("/plans", json=plan)
@@ -84,9 +85,13 @@ async def test_update_existing_plan():
         "goals": ["plank: two minute"],
         "duration": 30,
         "blocked": False,
-        "favourited_by": [],
+        "favourite_count": 0,
+        "review_count": 0,
+        "review_score_sum": 0,
+        "version": 2,
     }
 
+    assert current_plan.pop("updated_at") is not None
     assert current_plan == expected_plan
 
 
@@ -101,7 +106,6 @@ async def test_update_with_empty_body():
         "goals": ["plank: one minute"],
         "duration": 90,
         "blocked": False,
-        "favourited_by": [],
     }
     async with AsyncClient(app=app, base_url="http://test") as ac:
         response = await ac.post("/plans", json=plan)
@@ -130,9 +134,13 @@ async def test_update_with_empty_body():
         "goals": ["plank: one minute"],
         "duration": 90,
         "blocked": False,
-        "favourited_by": [],
+        "favourite_count": 0,
+        "review_count": 0,
+        "review_score_sum": 0,
+        "version": 1,
     }
 
+    assert current_plan.pop("updated_at") is not None
     assert current_plan == expected_plan
 
 
@@ -200,7 +208,6 @@ async def test_obtain_created_plans_of_certain_trainer():
         "duration": 30,
         "reviews": None,
         "blocked": False,
-        "favourited_by": [],
     }
 
     plan_2 = {
@@ -213,7 +220,6 @@ async def test_obtain_created_plans_of_certain_trainer():
         "duration": 120,
         "reviews": None,
         "blocked": False,
-        "favourited_by": [],
     }
 
     plan_1_ = {
@@ -226,7 +232,6 @@ async def test_obtain_created_plans_of_certain_trainer():
         "goals": ["plank: one minute"],
         "duration": 30,
         "blocked": False,
-        "favourited_by": [],
     }
 
     plan_2_ = {
@@ -239,7 +244,6 @@ async def test_obtain_created_plans_of_certain_trainer():
         "goals": ["plank: one minute"],
         "duration": 120,
         "blocked": False,
-        "favourited_by": [],
     }
     expected = [plan_1_, plan_2_]
 
@@ -633,7 +637,6 @@ async def test_users_adds_plan_as_favourite():
         "duration": 30,
         "reviews": None,
         "blocked": False,
-        "favourited_by": [],
     }
 
     async with AsyncClient(app=app, base_url="http://test") as ac:
@@ -650,7 +653,10 @@ async def test_users_adds_plan_as_favourite():
 
     async with AsyncClient(app=app, base_url="http://test") as ac:
         plan = await app.mongodb[TRAININGS_COLLECTION_NAME].find_one({"_id": id})
-        assert plan["favourited_by"][0] == "user_id"
+        assert plan["favourite_count"] == 1
+
+    favourite = await app.mongodb[FAVOURITES_COLLECTION_NAME].find_one({"plan_id": id})
+    assert favourite["user_id"] == "user_id"
 
 
 @pytest.mark.anyio
@@ -676,12 +682,13 @@ async def test_user_deletes_favourite_from_plan():
         "duration": 30,
         "reviews": None,
         "blocked": False,
-        "favourited_by": ["user_id"],
     }
 
     async with AsyncClient(app=app, base_url="http://test") as ac:
         response = await ac.post("/plans", json=plan)
         id = response.json()["_id"]
+        to_favourite = {"training_id": id}
+        await ac.post("/users/user_id/trainings/favourites", json=to_favourite)
 
     async with AsyncClient(app=app, base_url="http://test") as ac:
         response = await ac.delete(f"/users/user_id/trainings/favourites/{id}")
@@ -690,7 +697,10 @@ async def test_user_deletes_favourite_from_plan():
 
     async with AsyncClient(app=app, base_url="http://test") as ac:
         plan = await app.mongodb[TRAININGS_COLLECTION_NAME].find_one({"_id": id})
-        assert plan["favourited_by"] == []
+        assert plan["favourite_count"] == 0
+
+    favourite = await app.mongodb[FAVOURITES_COLLECTION_NAME].find_one({"plan_id": id})
+    assert favourite is None
 
 
 @pytest.mark.anyio
@@ -718,7 +728,6 @@ async def test_get_user_favourite_plans():
             "goals": ["plank: one minute"],
             "duration": 30,
             "reviews": None,
-            "favourited_by": ["user_id"],
         },
         {
             "trainer": trainer,
@@ -730,7 +739,6 @@ async def test_get_user_favourite_plans():
             "goals": ["plank: one minute"],
             "duration": 120,
             "reviews": None,
-            "favourited_by": ["user_id"],
         },
         {
             "trainer": trainer,
@@ -741,7 +749,6 @@ async def test_get_user_favourite_plans():
             "media": ["link-to-image", "link-to-video"],
             "goals": ["plank: one minute"],
             "duration": 30,
-            "favourited_by": [],
         },
         {
             "trainer": trainer,
@@ -752,13 +759,15 @@ async def test_get_user_favourite_plans():
             "media": ["link-to-image", "link-to-video"],
             "goals": ["plank: one minute"],
             "duration": 120,
-            "favourited_by": ["user_id"],
         },
     ]
 
-    for plan in plans:
+    for i, plan in enumerate(plans):
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.post("/plans", json=plan)
+            if i != 2:
+                to_favourite = {"training_id": response.json()["_id"]}
+                await ac.post("/users/user_id/trainings/favourites", json=to_favourite)
 
     async with AsyncClient(app=app, base_url="http://test") as ac:
         response = await ac.get("/users/user_id/trainings/favourites")
@@ -768,6 +777,39 @@ async def test_get_user_favourite_plans():
     assert len(json_result) == 3
 
 
+@pytest.mark.anyio
+async def test_favourites_pages_go_on_past_missing_plans():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        ids = []
+        for _ in range(3):
+            id = (await ac.post("/plans", json=plan)).json()["_id"]
+            await ac.post(
+                "/users/user_id/trainings/favourites", json={"training_id": id}
+            )
+            ids.append(id)
+        ids.sort()
+        # Left behind by a delete_plan that hasn't removed its favourites yet
+        await app.mongodb[TRAININGS_COLLECTION_NAME].delete_one({"_id": ids[0]})
+
+        params = {"limit": 2}
+        response = await ac.get("/users/user_id/trainings/favourites", params=params)
+        assert [plan["_id"] for plan in response.json()] == [ids[1]]
+
+        params["cursor"] = response.headers["X-Next-Cursor"]
+        response = await ac.get("/users/user_id/trainings/favourites", params=params)
+
+    assert [plan["_id"] for plan in response.json()] == [ids[2]]
+
+
 @pytest.mark.anyio
 async def test_fail_to_delete_favourite_plan_not_found():
     async with AsyncClient(app=app, base_url="http://test") as ac:
@@ -787,7 +829,6 @@ async def test_get_trainer_plan():
         "goals": ["plank: one minute"],
         "duration": 30,
         "blocked": False,
-        "favourited_by": ["user_id"],
     }
 
     async with AsyncClient(app=app, base_url="http://test") as ac:
@@ -809,3 +850,363 @@ async def test_get_trainer_plan_with_nonexistent_plan_id():
         response = await ac.get("/plans/abc")
 
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.anyio
+async def test_adding_the_same_favourite_twice_counts_it_once():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan)
+        id = response.json()["_id"]
+
+    to_favourite = {"training_id": id}
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await ac.post("/users/user_id/trainings/favourites", json=to_favourite)
+        await ac.post("/users/user_id/trainings/favourites", json=to_favourite)
+
+    plan = await app.mongodb[TRAININGS_COLLECTION_NAME].find_one({"_id": id})
+    assert plan["favourite_count"] == 1
+
+
+@pytest.mark.anyio
+async def test_block_plans_reports_the_outcome_of_every_plan():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+        "blocked": False,
+    }
+
+    ids = []
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        for _ in range(2):
+            response = await ac.post("/plans", json=plan)
+            ids.append(response.json()["_id"])
+
+    to_block = [
+        {"uid": ids[0], "blocked": True},
+        {"uid": "abc", "blocked": True},
+        {"uid": ids[1], "blocked": False},
+    ]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.patch("/plans", json=to_block)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["results"] == [
+        {"uid": ids[0], "status": "updated"},
+        {"uid": "abc", "status": "not_found"},
+        {"uid": ids[1], "status": "unchanged"},
+    ]
+
+    plan = await app.mongodb[TRAININGS_COLLECTION_NAME].find_one({"_id": ids[0]})
+    assert plan["blocked"] == True
+
+
+@pytest.mark.anyio
+async def test_page_through_plans_with_a_cursor():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        ids = set()
+        for _ in range(5):
+            response = await ac.post("/plans", json=plan)
+            ids.add(response.json()["_id"])
+
+        seen = []
+        params = {"limit": 2}
+        while True:
+            response = await ac.get("/plans", params=params)
+            assert response.status_code == status.HTTP_200_OK
+            seen += [plan["_id"] for plan in response.json()]
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert len(seen) == len(ids)
+    assert set(seen) == ids
+
+
+@pytest.mark.anyio
+async def test_get_plans_with_invalid_cursor():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/plans", params={"cursor": "not a cursor"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.anyio
+async def test_get_plans_summary_view():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan)
+        id = response.json()["_id"]
+
+        response = await ac.get("/plans", params={"view": "summary"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {
+            "_id": id,
+            "trainer": "Abdulazeez trainer",
+            "title": "Pilates training plan",
+            "difficulty": "beginner",
+            "training_types": ["cardio"],
+            "duration": 30,
+            "blocked": False,
+        }
+    ]
+
+
+@pytest.mark.anyio
+async def test_get_trainer_plans_with_selected_fields():
+    trainer = "Abdulazeez trainer"
+    plan = {
+        "trainer": trainer,
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan)
+        id = response.json()["_id"]
+
+        params = {"fields": "title,duration"}
+        response = await ac.get(f"/trainers/{trainer}/plans", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [
+            {"_id": id, "title": "Pilates training plan", "duration": 30}
+        ]
+
+        params = {"fields": "title,favourite_count"}
+        response = await ac.get(f"/trainers/{trainer}/plans", params=params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.anyio
+async def test_get_plan_answers_not_modified_while_unchanged():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan)
+        id = response.json()["_id"]
+
+        response = await ac.get(f"/plans/{id}")
+        etag = response.headers["ETag"]
+        response = await ac.get(f"/plans/{id}", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+
+        await ac.put(f"/plans/{id}", json={"title": "Updated training plan"})
+        response = await ac.get(f"/plans/{id}", headers={"If-None-Match": etag})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.anyio
+async def test_update_plan_with_a_stale_etag_fails():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan)
+        id = response.json()["_id"]
+        etag = response.headers["ETag"]
+
+        headers = {"If-Match": etag}
+        response = await ac.put(f"/plans/{id}", json={"duration": 40}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+        response = await ac.put(f"/plans/{id}", json={"duration": 50}, headers=headers)
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+        response = await ac.get(f"/plans/{id}")
+
+    assert response.json()["duration"] == 40
+
+
+@pytest.mark.anyio
+async def test_get_trainer_plans_answers_not_modified_while_unchanged():
+    trainer = "Abdulazeez trainer"
+    plan = {
+        "trainer": trainer,
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await ac.post("/plans", json=plan)
+
+        response = await ac.get(f"/trainers/{trainer}/plans")
+        etag = response.headers["ETag"]
+        headers = {"If-None-Match": etag}
+        response = await ac.get(f"/trainers/{trainer}/plans", headers=headers)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        await ac.post("/plans", json=plan)
+        response = await ac.get(f"/trainers/{trainer}/plans", headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 2
+
+
+@pytest.mark.anyio
+async def test_get_trainer_plans_views_have_their_own_etag():
+    trainer = "Abdulazeez trainer"
+    plan = {
+        "trainer": trainer,
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await ac.post("/plans", json=plan)
+        params = {"view": "summary"}
+        response = await ac.get(f"/trainers/{trainer}/plans", params=params)
+        headers = {"If-None-Match": response.headers["ETag"]}
+        response = await ac.get(f"/trainers/{trainer}/plans", headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0]["goals"] == ["plank: one minute"]
+
+
+@pytest.mark.anyio
+async def test_batch_get_plans_keeps_order_and_reports_missing():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "description": "A pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        ids = [(await ac.post("/plans", json=plan)).json()["_id"] for _ in range(3)]
+        # One of them is already cached
+        await ac.get(f"/plans/{ids[1]}")
+
+        body = {"ids": [ids[2], "missing", ids[0], ids[1]]}
+        response = await ac.post("/plans:batchGet", json=body)
+
+    assert response.status_code == status.HTTP_200_OK
+    body = response.json()
+    assert [plan["_id"] for plan in body["plans"]] == [ids[2], ids[0], ids[1]]
+    assert body["missing"] == ["missing"]
+
+
+@pytest.mark.anyio
+async def test_plans_are_sent_without_internal_fields():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "title": "Pilates training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": [{"name": "plank", "amount": "60", "media": ["imagen.com"]}],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/plans", json=plan)
+        id = response.json()["_id"]
+
+        expected = {**plan, "_id": id, "description": None, "blocked": False}
+        response = await ac.get(f"/plans/{id}")
+        assert response.json() == expected
+
+        response = await ac.get("/plans")
+        assert response.json() == [expected]
+
+    schema = app.openapi()["paths"]["/plans/{plan_id}"]["get"]["responses"]["200"]
+    assert schema["content"]["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/TrainingPlan"
+    }
+
+
+@pytest.mark.anyio
+async def test_search_plans_ranks_by_relevance():
+    plan = {
+        "trainer": "Abdulazeez trainer",
+        "description": "A training plan",
+        "difficulty": "beginner",
+        "training_types": ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": 30,
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await ac.post("/plans", json={**plan, "title": "Running plan"})
+        response = await ac.post(
+            "/plans", json={**plan, "title": "Yoga", "description": "Pilates and yoga"}
+        )
+        in_description = response.json()["_id"]
+        response = await ac.post("/plans", json={**plan, "title": "Pilates plan"})
+        in_title = response.json()["_id"]
+
+        params = {"q": "pilates", "limit": 1, "boost": False}
+        response = await ac.get("/plans/search", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        assert [plan["_id"] for plan in response.json()] == [in_title]
+
+        params["cursor"] = response.headers["X-Next-Cursor"]
+        response = await ac.get("/plans/search", params=params)
+
+    assert [plan["_id"] for plan in response.json()] == [in_description]
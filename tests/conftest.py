@@ -5,6 +5,29 @@ from app.main import app
 from app.config.database import (
     DB_NAME,
 )
+from app.config.indexes import ensure_indexes
+
+
+def plan(
+    title: str = "Sample training plan",
+    difficulty: str = "beginner",
+    training_types: list[str] | None = None,
+    duration: int = 30,
+) -> dict:
+    """Body of a valid POST /plans request"""
+    return {
+        "trainer": "Abdulazeez trainer",
+        "title": title,
+        "description": "A pilates training plan",
+        "difficulty": difficulty,
+        "training_types": training_types or ["cardio"],
+        "goals": ["plank: one minute"],
+        "duration": duration,
+    }
+
+
+def create_plan(test_app: TestClient) -> str:
+    return test_app.post("/plans", json=plan()).json()["_id"]
 
 
 @fixture
@@ -19,9 +42,12 @@ def test_app():
 
 
 @fixture(autouse=True, scope="function")
-async def cleanup():
+async def cleanup(test_app):
     yield
     await app.mongodb_client.drop_database(DB_NAME)
+    await ensure_indexes(app.mongodb)
+    app.entity_cache.clear()
+    app.listing_cache.clear()
 
 
 environ["TESTING"] = "TRUE"